@@ -1,21 +1,193 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import redis
-import json
+from codec import JSON_BODY, get_codec
 from config import settings
 
-class RedisCache:
+# версія формату значень у Redis
+CACHE_FORMAT = "v2"
+
+# як часто репліка без блокування перевіряє, чи з'явилось значення від репліки з блокуванням
+LOCK_POLL = 0.05
+
+# видаляє блокування, тільки якщо воно ще наше (могло протермінуватись і дістатись іншій репліці)
+RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class Flight:
+    """Одне завантаження ключа в процесі: інші потоки з тим самим ключем чекають його результат"""
+
     def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+        self.error = None
+
+
+class RedisCache:
+    """Значення кодуються один раз кодеком CACHE_CODEC і зберігаються як байти (без decode_responses).
+
+    Перед тілом - рядок з часом м'якого терміну (мс): до нього значення свіже, після - застаріле, але
+    ще віддається, поки одна репліка оновлює його у фоні. Redis видаляє ключ після жорсткого терміну"""
+
+    def __init__(self, codec=None):
         self.client = redis.Redis(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
-            decode_responses=True
+            db=settings.REDIS_DB
         )
+        self.codec = codec or get_codec(settings.CACHE_CODEC)
+        self.stale_while_revalidate = settings.CACHE_STALE_WHILE_REVALIDATE
+        self.lock_ttl = settings.CACHE_LOCK_TTL
+        self.flights = {}
+        self.refreshing = set()
+        self.flights_lock = threading.Lock()
+        self.refresher = ThreadPoolExecutor(max_workers=settings.CACHE_REFRESH_WORKERS)
+
+    def key(self, key: str) -> str:
+        # назва кодека і версія формату в ключі: після зміни CACHE_CODEC або формату значення (v2 - з рядком
+        # м'якого терміну перед тілом) старі значення не читаються, а просто закінчуються за своїм TTL
+        return f"{self.codec.name}:{CACHE_FORMAT}:{key}"
+
+    @staticmethod
+    def unpack(data: bytes):
+        """(м'який термін в секундах epoch, тіло)"""
+        fresh_until, _, body = data.partition(b"\n")
+        return int(fresh_until) / 1000, body
+
+    def get_raw(self, key: str):
+        data = self.client.get(self.key(key))
+        if data is not None:
+            return self.unpack(data)[1]
+        return None
 
     def get(self, key: str):
-        data = self.client.get(key)
-        if data:
-            return json.loads(data)
+        data = self.get_raw(key)
+        if data is not None:
+            return self.codec.loads(data)
+        return None
+
+    def set(self, key: str, value: dict, ttl: int, hard_ttl: int = None) -> bytes:
+        """Свіже ttl секунд, у Redis - hard_ttl (без stale-while-revalidate - теж ttl). Повертає тіло"""
+        body = self.codec.dumps(value)
+        if not self.stale_while_revalidate or hard_ttl is None:
+            hard_ttl = ttl
+        fresh_until = int((time.time() + ttl) * 1000)
+        self.client.setex(self.key(key), max(ttl, hard_ttl), b"%d\n" % fresh_until + body)
+        return body
+
+    def http_body(self, data: bytes) -> bytes:
+        """JSON-тіло відповіді зі збережених байтів: для JSON-кодеків - ті самі байти без декодування"""
+        if self.codec.http_body:
+            return data
+        return JSON_BODY.dumps(self.codec.loads(data))
+
+    def get_or_load(self, key: str, load, ttl: int, hard_ttl: int = None):
+        """Тіло значення з кешу або від load() (dict або None, якщо запису немає).
+
+        Промах: у процесі load() виконує один потік, між репліками - той, хто взяв блокування в Redis.
+        Застаріле значення віддається одразу, оновлення - у фоні, не більше одного на ключ"""
+        start = time.perf_counter()
+        data = self.client.get(self.key(key))
+        if data is not None:
+            fresh_until, body = self.unpack(data)
+            duration = time.perf_counter() - start
+            if time.time() < fresh_until:
+                print(f"[CACHE HIT] {key} → took {duration:.4f}s")
+            else:
+                print(f"[CACHE STALE] {key} → took {duration:.4f}s, refreshing in background")
+                self.refresh(key, load, ttl, hard_ttl)
+            return body
+
+        print(f"[CACHE MISS] {key} → querying DB...")
+        return self.load_once(key, load, ttl, hard_ttl)
+
+    def load_once(self, key, load, ttl, hard_ttl):
+        with self.flights_lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.body
+
+        try:
+            flight.body = self.load_shared(key, load, ttl, hard_ttl)
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self.flights_lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.body
+
+    def load_shared(self, key, load, ttl, hard_ttl):
+        token = self.acquire(key)
+        if token is None:
+            # інша репліка вже завантажує ключ: чекаємо значення в кеші не довше за термін блокування
+            deadline = time.monotonic() + self.lock_ttl
+            while token is None and time.monotonic() < deadline:
+                time.sleep(LOCK_POLL)
+                body = self.get_raw(key)
+                if body is not None:
+                    return body
+                # блокування зняли без значення (запису немає або помилка) - завантажуємо самі
+                token = self.acquire(key)
+        try:
+            value = load()
+            if value is None:
+                return None
+            return self.set(key, value, ttl, hard_ttl)
+        finally:
+            if token is not None:
+                self.release(key, token)
+
+    def refresh(self, key, load, ttl, hard_ttl):
+        with self.flights_lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        token = self.acquire(key)
+        if token is None:
+            # оновлює інша репліка
+            with self.flights_lock:
+                self.refreshing.discard(key)
+            return
+        self.refresher.submit(self._refresh, key, load, ttl, hard_ttl, token)
+
+    def _refresh(self, key, load, ttl, hard_ttl, token):
+        try:
+            value = load()
+            if value is None:
+                self.client.delete(self.key(key))
+            else:
+                self.set(key, value, ttl, hard_ttl)
+        except Exception as err:
+            # застаріле значення лишається до жорсткого терміну, наступний запит спробує ще раз
+            print(f"[CACHE REFRESH FAILED] {key}: {err}")
+        finally:
+            self.release(key, token)
+            with self.flights_lock:
+                self.refreshing.discard(key)
+
+    def acquire(self, key: str):
+        """Блокування ключа між репліками; токен або None, якщо його тримає хтось інший"""
+        token = uuid.uuid4().hex
+        if self.client.set(f"lock:{self.key(key)}", token, nx=True, px=int(self.lock_ttl * 1000)):
+            return token
         return None
 
-    def set(self, key: str, value: dict, ttl: int):
-        self.client.setex(key, ttl, json.dumps(value))
\ No newline at end of file
+    def release(self, key: str, token: str):
+        self.client.eval(RELEASE_LOCK, 1, f"lock:{self.key(key)}", token)
@@ -0,0 +1,74 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _default(value):
+    """Типи з MySQL, яких немає в JSON: дата/час - ISO-рядок, DECIMAL - float"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not serializable")
+
+
+class JsonCodec:
+    """Стандартний json: збережені байти - готове тіло HTTP-відповіді"""
+    name = "json"
+    http_body = True
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+    def loads(self, data: bytes):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    """orjson: той самий JSON, але кодування в кілька разів швидше"""
+    name = "orjson"
+    http_body = True
+
+    def dumps(self, value) -> bytes:
+        return orjson.dumps(value, default=_default)
+
+    def loads(self, data: bytes):
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    """msgpack: компактніше в Redis, але при відповіді байти перекодовуються в JSON"""
+    name = "msgpack"
+    http_body = False
+
+    def dumps(self, value) -> bytes:
+        return msgpack.packb(value, default=_default)
+
+    def loads(self, data: bytes):
+        return msgpack.unpackb(data)
+
+
+CODECS = {"json": JsonCodec, "orjson": OrjsonCodec, "msgpack": MsgpackCodec}
+MODULES = {"orjson": orjson, "msgpack": msgpack}
+
+
+def get_codec(name: str):
+    if name not in CODECS:
+        raise ValueError(f"Unknown cache codec {name!r}, expected one of {', '.join(CODECS)}")
+    if name in MODULES and MODULES[name] is None:
+        raise ImportError(f"Cache codec {name!r} requires the {name} package")
+    return CODECS[name]()
+
+
+# кодек тіла відповіді для форматів, які не є JSON
+JSON_BODY = OrjsonCodec() if orjson is not None else JsonCodec()
@@ -9,9 +9,21 @@ class Settings:
     MYSQL_USER = os.getenv("MYSQL_USER", "root")
     MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "password")
     MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "ad_analytics")
+    # з'єднань у пулі на один процес uvicorn (mysql-connector дозволяє до 32)
+    MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 10))
+    # скільки секунд запит чекає вільне з'єднання, далі - 503
+    MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", 5))
 
     REDIS_HOST = os.getenv("REDIS_HOST", "redis")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB = 0
+    # формат значень у Redis: orjson, json або msgpack
+    CACHE_CODEC = os.getenv("CACHE_CODEC", "orjson")
+    # після м'якого TTL віддавати застаріле значення, поки один запит оновлює його у фоні
+    CACHE_STALE_WHILE_REVALIDATE = os.getenv("CACHE_STALE_WHILE_REVALIDATE", "true").lower() == "true"
+    # скільки секунд діє блокування завантаження ключа в Redis (спільне для всіх реплік API)
+    CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", 10))
+    # потоки фонового оновлення застарілих значень
+    CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", 4))
 
 settings = Settings()
\ No newline at end of file
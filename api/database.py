@@ -1,16 +1,59 @@
-import mysql.connector
+import threading
+from contextlib import contextmanager
+
+from mysql.connector import errors, pooling
 from config import settings
 
 class MySQLDatabase:
-    def __init__(self):
-        self.conn = mysql.connector.connect(
+    """Пул з'єднань: кожен запит бере власне з'єднання і курсор, тому ендпоінти, які FastAPI виконує
+    в пулі потоків, не ділять один курсор і не чекають один на одного"""
+
+    def __init__(self, pool_size: int = settings.MYSQL_POOL_SIZE, timeout: float = settings.MYSQL_POOL_TIMEOUT):
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name="api",
+            pool_size=pool_size,
+            pool_reset_session=True,
             host=settings.MYSQL_HOST,
             port=settings.MYSQL_PORT,
             user=settings.MYSQL_USER,
             password=settings.MYSQL_PASSWORD,
-            database=settings.MYSQL_DATABASE
+            database=settings.MYSQL_DATABASE,
+            # тільки читання: без довгих транзакцій зі старим знімком даних
+            autocommit=True
         )
-        self.cursor = self.conn.cursor(dictionary=True)
+        # MySQLConnectionPool одразу кидає PoolError, якщо вільних з'єднань немає - запит чекає до timeout
+        self.available = threading.BoundedSemaphore(pool_size)
+        self.timeout = timeout
+
+    @contextmanager
+    def connection(self):
+        """З'єднання з пулу; пул перевіряє його (ping) і перепідключається, якщо з'єднання розірване"""
+        if not self.available.acquire(timeout=self.timeout):
+            raise errors.PoolError(f"No free MySQL connection in {self.timeout}s")
+        try:
+            conn = self.pool.get_connection()
+            try:
+                yield conn
+            finally:
+                # повертає з'єднання в пул
+                conn.close()
+        finally:
+            self.available.release()
+
+    def query(self, query: str, params: tuple, fetch_all: bool = False):
+        """Один повтор на новому з'єднанні, якщо з'єднання обірвалось під час запиту"""
+        for attempt in (1, 2):
+            try:
+                with self.connection() as conn:
+                    cursor = conn.cursor(dictionary=True)
+                    try:
+                        cursor.execute(query, params)
+                        return cursor.fetchall() if fetch_all else cursor.fetchone()
+                    finally:
+                        cursor.close()
+            except (errors.OperationalError, errors.InterfaceError):
+                if attempt == 2:
+                    raise
 
     def fetch_campaign_performance(self, campaign_id: int):
         query = """
@@ -21,8 +64,7 @@ class MySQLDatabase:
         FROM AdEvents
         WHERE CampaignID = %s
         """
-        self.cursor.execute(query, (campaign_id,))
-        row = self.cursor.fetchone()
+        row = self.query(query, (campaign_id,))
 
         if not row:
             return None
@@ -41,8 +83,7 @@ class MySQLDatabase:
         JOIN Campaigns c ON e.CampaignID = c.CampaignID
         WHERE c.AdvertiserID = %s
         """
-        self.cursor.execute(query, (advertiser_id,))
-        row = self.cursor.fetchone()
+        row = self.query(query, (advertiser_id,))
 
         if not row:
             return None
@@ -58,7 +99,4 @@ class MySQLDatabase:
         ORDER BY Timestamp DESC
         LIMIT 10
         """
-        self.cursor.execute(query, (user_id,))
-        columns = [desc[0] for desc in self.cursor.description]
-        rows = self.cursor.fetchall()
-        return rows
+        return self.query(query, (user_id,), fetch_all=True)
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+from mysql.connector.errors import PoolError
 from database import MySQLDatabase
 from cache import RedisCache
 from services.campaign_service import CampaignService
@@ -20,23 +22,32 @@ campaign_service = CampaignService(db, cache)
 advertiser_service = AdvertiserService(db, cache)
 user_service = UserService(db, cache)
 
+@app.exception_handler(PoolError)
+def pool_exhausted(request: Request, exc: PoolError):
+    # всі з'єднання пулу зайняті довше за MYSQL_POOL_TIMEOUT
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, try again later"})
+
+def json_body(body: bytes) -> Response:
+    # готові байти з кешу: response_model лишається для документації, валідації й повторної серіалізації немає
+    return Response(content=body, media_type="application/json")
+
 @app.get("/campaign/{campaign_id}/performance", response_model=CampaignPerformanceResponse)
 def get_campaign_performance(campaign_id: int):
-    data = campaign_service.get_campaign_performance(campaign_id)
-    if data is None:
+    body = campaign_service.get_campaign_performance(campaign_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Campaign not found")
-    return data
+    return json_body(body)
 
 @app.get("/advertiser/{advertiser_id}/spending", response_model=AdvertiserSpendingResponse)
 def get_advertiser_spending(advertiser_id: int):
-    data = advertiser_service.get_advertiser_spending(advertiser_id)
-    if data is None:
+    body = advertiser_service.get_advertiser_spending(advertiser_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="Advertiser not found")
-    return data
+    return json_body(body)
 
 @app.get("/user/{user_id}/engagements", response_model=UserEngagementsResponse)
 def get_user_engagements(user_id: int):
-    data = user_service.get_user_engagements(user_id)
-    if data is None:
+    body = user_service.get_user_engagements(user_id)
+    if body is None:
         raise HTTPException(status_code=404, detail="User not found or no engagements")
-    return data
\ No newline at end of file
+    return json_body(body)
\ No newline at end of file
@@ -1,24 +1,21 @@
 import time
 from cache import RedisCache
 from database import MySQLDatabase
-import json
 
 class AdvertiserService:
-    def __init__(self, db: MySQLDatabase, cache: RedisCache, ttl=300):
+    def __init__(self, db: MySQLDatabase, cache: RedisCache, ttl=300, hard_ttl=1800):
         self.db = db
         self.cache = cache
         self.ttl = ttl
+        self.hard_ttl = hard_ttl
 
     def get_advertiser_spending(self, advertiser_id: int):
+        """JSON-тіло відповіді (bytes): при попаданні в кеш - байти з Redis без декодування"""
         cache_key = f"advertiser:{advertiser_id}:spending"
-        start = time.perf_counter()
-        cached = self.cache.get(cache_key)
-        if cached:
-            duration = time.perf_counter() - start
-            print(f"[CACHE HIT] {cache_key} → took {duration:.4f}s")
-            return json.loads(cached)
+        body = self.cache.get_or_load(cache_key, lambda: self.load(advertiser_id), self.ttl, self.hard_ttl)
+        return self.cache.http_body(body) if body is not None else None
 
-        print(f"[CACHE MISS] {cache_key} → querying DB...")
+    def load(self, advertiser_id: int):
         start = time.perf_counter()
         row = self.db.fetch_advertiser_spending(advertiser_id)
         duration = time.perf_counter() - start
@@ -27,10 +24,8 @@ class AdvertiserService:
         if not row:
             return None
 
-        data = {
+        return {
             "advertiser_id": advertiser_id,
-            "total_spend": float(row.get("total_spend", 0.0))
+            # SUM без жодної події - NULL
+            "total_spend": float(row.get("total_spend") or 0.0)
         }
-
-        self.cache.set(cache_key, json.dumps(data), self.ttl)
-        return data
@@ -1,24 +1,21 @@
 import time
 from cache import RedisCache
 from database import MySQLDatabase
-import json
 
 class CampaignService:
-    def __init__(self, db: MySQLDatabase, cache: RedisCache, ttl=30):
+    def __init__(self, db: MySQLDatabase, cache: RedisCache, ttl=30, hard_ttl=300):
         self.db = db
         self.cache = cache
         self.ttl = ttl
+        self.hard_ttl = hard_ttl
 
     def get_campaign_performance(self, campaign_id: int):
+        """JSON-тіло відповіді (bytes): при попаданні в кеш - байти з Redis без декодування"""
         cache_key = f"campaign:{campaign_id}:performance"
-        start_redis = time.perf_counter()
-        cached = self.cache.get(cache_key)
-        if cached:
-            duration = time.perf_counter() - start_redis
-            print(f"[CACHE HIT] {cache_key} → took {duration:.4f}s")
-            return json.loads(cached)
+        body = self.cache.get_or_load(cache_key, lambda: self.load(campaign_id), self.ttl, self.hard_ttl)
+        return self.cache.http_body(body) if body is not None else None
 
-        print(f"[CACHE MISS] {cache_key} → querying DB...")
+    def load(self, campaign_id: int):
         start_db = time.perf_counter()
         row = self.db.fetch_campaign_performance(campaign_id)
         duration = time.perf_counter() - start_db
@@ -27,13 +24,10 @@ class CampaignService:
         if not row:
             return None
 
-        data = {
+        return {
             "campaign_id": campaign_id,
             "clicks": int(row.get("clicks", 0)),
             "impressions": int(row.get("impressions", 0)),
             "ctr": float(row.get("ctr", 0.0)),
             "spend": float(row.get("spend", 0.0)),
         }
-
-        self.cache.set(cache_key, json.dumps(data), self.ttl)
-        return data
\ No newline at end of file
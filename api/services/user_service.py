@@ -1,27 +1,23 @@
 import time
 from database import MySQLDatabase
 from cache import RedisCache
-import json
-from datetime import datetime
-from models.response_schemas import UserEngagementsResponse
 
 class UserService:
-    def __init__(self, db: MySQLDatabase, cache: RedisCache, ttl=60):
+    def __init__(self, db: MySQLDatabase, cache: RedisCache, ttl=60, hard_ttl=600):
         self.db = db
         self.cache = cache
         self.ttl = ttl
+        self.hard_ttl = hard_ttl
 
-    def get_user_engagements(self, user_id: int) -> UserEngagementsResponse:
+    def get_user_engagements(self, user_id: int):
+        """JSON-тіло відповіді (bytes) у форматі UserEngagementsResponse: при попаданні в кеш - байти
+        з Redis без parse_raw"""
         cache_key = f"user:{user_id}:engagements"
-        start = time.perf_counter()
-
-        cached = self.cache.get(cache_key)
-        if cached:
-            duration = time.perf_counter() - start
-            print(f"[CACHE HIT] {cache_key} → took {duration:.4f}s")
-            return UserEngagementsResponse.parse_raw(cached)
+        body = self.cache.get_or_load(cache_key, lambda: self.load(user_id), self.ttl, self.hard_ttl)
+        return self.cache.http_body(body) if body is not None else None
 
-        print(f"[CACHE MISS] {cache_key} → querying DB...")
+    def load(self, user_id: int):
+        start = time.perf_counter()
         engagements = self.db.fetch_user_engagements(user_id)
         duration = time.perf_counter() - start
         print(f"[DB QUERY] took {duration:.4f}s")
@@ -29,10 +25,15 @@ class UserService:
         if not engagements:
             return None
 
-        for e in engagements:
-            if isinstance(e.get("event_time"), datetime):
-                e["event_time"] = e["event_time"].isoformat()
-
-        result = {"user_id": user_id, "engagements": engagements}
-        self.cache.set(cache_key, json.dumps(result), self.ttl)
-        return UserEngagementsResponse(**result)
\ No newline at end of file
+        # відповідь не проходить через Pydantic: типи приводяться тут (event_time кодек пише як ISO)
+        return {
+            "user_id": user_id,
+            "engagements": [
+                {
+                    "campaign_id": int(e["campaign_id"]),
+                    "was_clicked": bool(e["was_clicked"]),
+                    "event_time": e["event_time"],
+                }
+                for e in engagements
+            ]
+        }
@@ -0,0 +1,92 @@
+# benchmarks/bench_row_building.py
+# Порівняння побудови рядків AdEvents: старий цикл iterrows() проти векторної версії з transform_load
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transform_load import EVENT_COLUMNS, build_ad_event_rows  # noqa: E402
+
+
+def make_events(rows, campaigns=1000, seed=42):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp("2024-10-01") + pd.to_timedelta(
+        rng.integers(0, 60 * 24 * 3600, rows), unit="s"
+    )
+    clicked = rng.random(rows) < 0.1
+    click_ts = pd.Series(timestamps + pd.to_timedelta(rng.integers(1, 600, rows), unit="s"))
+
+    df = pd.DataFrame(index=range(rows), columns=EVENT_COLUMNS)
+    df["EventID"] = [f"ev-{i}" for i in range(rows)]
+    df["CampaignName"] = "Campaign_" + pd.Series(rng.integers(1, campaigns + 1, rows)).astype(str)
+    df["UserID"] = rng.integers(1, 1_000_000, rows)
+    df["Device"] = rng.choice(["Desktop", "Mobile", "Tablet"], rows)
+    df["Timestamp"] = pd.Series(timestamps).dt.strftime("%Y-%m-%dT%H:%M:%S")
+    df["BidAmount"] = rng.uniform(0.5, 5, rows).round(2)
+    df["AdCost"] = (df["BidAmount"] * 0.8).round(2)
+    df["AdRevenue"] = np.where(clicked, rng.uniform(0, 10, rows).round(2), 0.0)
+    df["WasClicked"] = clicked
+    df["ClickTimestamp"] = click_ts.dt.strftime("%Y-%m-%dT%H:%M:%S").where(clicked)
+    return df
+
+
+def build_ad_event_rows_iterrows(df_events, campaign_map):
+    """Версія до векторизації (для порівняння)"""
+    ad_events_values = []
+    skipped_events = 0
+
+    for _, row in df_events.iterrows():
+        campaign_id = campaign_map.get(row["CampaignName"])
+        if campaign_id is None:
+            skipped_events += 1
+            continue
+
+        was_clicked = 1 if str(row["WasClicked"]).lower() == "true" else 0
+        click_timestamp = (
+            row["ClickTimestamp"]
+            if pd.notna(row["ClickTimestamp"]) and row["ClickTimestamp"] != ""
+            else None
+        )
+
+        ad_events_values.append(
+            (
+                row["EventID"],
+                campaign_id,
+                row["UserID"],
+                row["Device"],
+                row["Timestamp"],
+                row["BidAmount"],
+                row["AdCost"],
+                row["AdRevenue"],
+                was_clicked,
+                click_timestamp,
+            )
+        )
+
+    return ad_events_values, skipped_events
+
+
+def bench(name, func, df, campaign_map):
+    start = time.perf_counter()
+    rows, _ = func(df, campaign_map)
+    duration = time.perf_counter() - start
+    print(f"{name:<10} {len(rows):>10} rows  {duration:8.3f}s  {len(rows) / duration:12,.0f} rows/sec")
+    return duration
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000, help="Number of synthetic events")
+    args = parser.parse_args()
+
+    df = make_events(args.rows)
+    campaign_map = {f"Campaign_{i}": i for i in range(1, 1001)}
+
+    iterrows_time = bench("iterrows", build_ad_event_rows_iterrows, df, campaign_map)
+    vectorized_time = bench("vectorized", build_ad_event_rows, df, campaign_map)
+    print(f"Speedup: {iterrows_time / vectorized_time:.1f}x")
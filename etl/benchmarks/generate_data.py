@@ -0,0 +1,194 @@
+# benchmarks/generate_data.py
+# Детермінований генератор синтетичних AdTech даних з тим самим форматом файлів,
+# що й etl/data: ad_events (TargetingCriteria без лапок, 20 колонок), users.csv, campaigns.csv.
+# Події пишуться блоками, тому пам'ять не залежить від кількості рядків
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SCALES = {"1m": 1_000_000, "10m": 10_000_000, "100m": 100_000_000}
+
+COUNTRIES = ["USA", "UK", "Germany", "India", "Australia"]
+INTERESTS = ["Gaming", "Sports", "Technology", "Fashion", "Travel", "Health", "Finance", "Education", "Food", "Music"]
+GENDERS = ["Male", "Female", "Non-Binary"]
+DEVICES = ["Desktop", "Mobile", "Tablet"]
+AD_SLOT_SIZES = ["728x90", "300x250", "160x600", "320x50"]
+
+EVENTS_HEADER = (
+    "EventID,AdvertiserName,CampaignName,CampaignStartDate,CampaignEndDate,TargetingCriteria,AdSlotSize,"
+    "UserID,Device,Location,Timestamp,BidAmount,AdCost,WasClicked,ClickTimestamp,AdRevenue,Budget,RemainingBudget"
+)
+
+PERIOD_START = pd.Timestamp("2024-10-01")
+PERIOD_DAYS = 61
+
+
+def zipf_weights(n, skew):
+    """Ймовірності вибору i-го елемента ~ 1 / i^skew (skew = 0 - рівномірно)"""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+def generate_campaigns(rng, campaigns, advertisers):
+    start = PERIOD_START + pd.to_timedelta(rng.integers(0, PERIOD_DAYS - 14, campaigns), unit="D")
+    end = start + pd.to_timedelta(rng.integers(7, 45, campaigns), unit="D")
+    age_min = rng.integers(18, 35, campaigns)
+    budget = rng.uniform(10_000, 250_000, campaigns).round(2)
+
+    return pd.DataFrame(
+        {
+            "CampaignID": np.arange(1, campaigns + 1),
+            "AdvertiserName": [f"Advertiser_{i}" for i in rng.integers(1, advertisers + 1, campaigns)],
+            "CampaignName": [f"Campaign_{i}" for i in range(1, campaigns + 1)],
+            "CampaignStartDate": start.strftime("%Y-%m-%d"),
+            "CampaignEndDate": end.strftime("%Y-%m-%d"),
+            "TargetingAge": [f"Age {a}-{a + b}" for a, b in zip(age_min, rng.integers(10, 25, campaigns))],
+            "TargetingInterest": rng.choice(INTERESTS, campaigns),
+            "TargetingCountry": rng.choice(COUNTRIES, campaigns),
+            "AdSlotSize": rng.choice(AD_SLOT_SIZES, campaigns),
+            "Budget": budget,
+            "RemainingBudget": budget,
+        }
+    )
+
+
+def generate_users(rng, users):
+    interests_count = rng.integers(1, 4, users)
+    # до трьох різних інтересів: перші n з випадкової перестановки
+    picks = np.array(INTERESTS)[np.argsort(rng.random((users, len(INTERESTS))), axis=1)[:, :3]]
+    interests = [", ".join(row[:n]) for row, n in zip(picks, interests_count)]
+    signup = PERIOD_START - pd.to_timedelta(rng.integers(0, 3 * 365, users), unit="D")
+
+    return pd.DataFrame(
+        {
+            "UserID": np.arange(1, users + 1),
+            "Age": rng.integers(18, 70, users),
+            "Gender": rng.choice(GENDERS, users),
+            "Location": rng.choice(COUNTRIES, users),
+            "Interests": interests,
+            "SignupDate": signup.strftime("%Y-%m-%d"),
+        }
+    )
+
+
+def generate_event_block(rng, offset, rows, df_campaigns, df_users, click_rate, weights):
+    campaign_weights, user_weights = weights
+    campaign_idx = rng.choice(len(df_campaigns), rows, p=campaign_weights)
+    user_idx = rng.choice(len(df_users), rows, p=user_weights)
+    campaigns = df_campaigns.iloc[campaign_idx].reset_index(drop=True)
+    users = df_users.iloc[user_idx].reset_index(drop=True)
+
+    timestamps = PERIOD_START + pd.to_timedelta(rng.integers(0, PERIOD_DAYS * 86400, rows), unit="s")
+    clicked = rng.random(rows) < click_rate
+    click_timestamps = timestamps + pd.to_timedelta(rng.integers(1, 600, rows), unit="s")
+    bid = rng.uniform(0.5, 5.0, rows).round(2)
+
+    return pd.DataFrame(
+        {
+            # UUID-подібний ID, унікальний в межах набору
+            "EventID": [f"00000000-0000-4000-8000-{i:012x}" for i in range(offset, offset + rows)],
+            "AdvertiserName": campaigns["AdvertiserName"],
+            "CampaignName": campaigns["CampaignName"],
+            "CampaignStartDate": campaigns["CampaignStartDate"],
+            "CampaignEndDate": campaigns["CampaignEndDate"],
+            # TargetingCriteria в подіях не в лапках - три окремі поля
+            "TargetingAge": campaigns["TargetingAge"],
+            "TargetingInterest": " " + campaigns["TargetingInterest"],
+            "TargetingCountry": " " + campaigns["TargetingCountry"],
+            "AdSlotSize": campaigns["AdSlotSize"],
+            "UserID": users["UserID"],
+            "Device": rng.choice(DEVICES, rows),
+            "Location": users["Location"],
+            "Timestamp": timestamps.strftime("%Y-%m-%dT%H:%M:%S"),
+            "BidAmount": bid,
+            "AdCost": (bid * rng.uniform(0.6, 1.0, rows)).round(2),
+            "WasClicked": np.where(clicked, "True", "False"),
+            "ClickTimestamp": pd.Series(click_timestamps.strftime("%Y-%m-%dT%H:%M:%S")).where(clicked, ""),
+            "AdRevenue": np.where(clicked, rng.uniform(0.5, 15.0, rows).round(2), 0.0),
+            "Budget": campaigns["Budget"],
+            "RemainingBudget": campaigns["RemainingBudget"],
+        }
+    )
+
+
+def generate(
+    out_dir,
+    events,
+    users=None,
+    campaigns=1000,
+    advertisers=100,
+    click_rate=0.1,
+    skew=1.1,
+    seed=42,
+    block_size=1_000_000,
+):
+    """Пише ad_events.csv, users.csv, campaigns.csv в out_dir. Той самий seed - ті самі файли"""
+    users = users or max(events // 20, 1)
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    df_campaigns = generate_campaigns(rng, campaigns, advertisers)
+    df_users = generate_users(rng, users)
+
+    campaigns_csv = df_campaigns.assign(
+        TargetingCriteria=df_campaigns["TargetingAge"]
+        + ", " + df_campaigns["TargetingInterest"]
+        + ", " + df_campaigns["TargetingCountry"]
+    )
+    campaigns_csv[
+        [
+            "CampaignID",
+            "AdvertiserName",
+            "CampaignName",
+            "CampaignStartDate",
+            "CampaignEndDate",
+            "TargetingCriteria",
+            "AdSlotSize",
+            "Budget",
+            "RemainingBudget",
+        ]
+    ].to_csv(os.path.join(out_dir, "campaigns.csv"), index=False)
+    df_users.to_csv(os.path.join(out_dir, "users.csv"), index=False)
+
+    weights = (zipf_weights(campaigns, skew), zipf_weights(users, skew))
+    events_path = os.path.join(out_dir, "ad_events.csv")
+    with open(events_path, "w", newline="") as f:
+        f.write(EVENTS_HEADER + "\n")
+        for offset in range(0, events, block_size):
+            rows = min(block_size, events - offset)
+            block = generate_event_block(rng, offset, rows, df_campaigns, df_users, click_rate, weights)
+            block.to_csv(f, header=False, index=False)
+            print(f"Generated {offset + rows}/{events} events")
+
+    return events_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--scale", choices=SCALES, help="Preset number of events: 1m, 10m or 100m")
+    parser.add_argument("--events", type=int, default=None, help="Number of events (overrides --scale)")
+    parser.add_argument("--users", type=int, default=None, help="Number of users (default: events / 20)")
+    parser.add_argument("--campaigns", type=int, default=1000)
+    parser.add_argument("--advertisers", type=int, default=100)
+    parser.add_argument("--click-rate", type=float, default=0.1)
+    parser.add_argument("--zipf", type=float, default=1.1, help="Skew of users and campaigns popularity (0 - uniform)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    events = args.events or SCALES.get(args.scale)
+    if not events:
+        parser.error("either --events or --scale is required")
+
+    generate(
+        args.out,
+        events,
+        users=args.users,
+        campaigns=args.campaigns,
+        advertisers=args.advertisers,
+        click_rate=args.click_rate,
+        skew=args.zipf,
+        seed=args.seed,
+    )
@@ -0,0 +1,237 @@
+# benchmarks/run_benchmarks.py
+# Запуск transform_load.py, load_to_mongo.py, load_to_cassandra.py на синтетичних наборах 1M/10M/100M подій
+# з записом пропускної здатності та кривої пам'яті (RSS процесу і його дочірніх процесів)
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import mysql.connector
+from pymongo import MongoClient
+
+ETL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ETL_DIR)
+
+import staging  # noqa: E402
+from cassandra_data.load_to_cassandra import CassandraClient  # noqa: E402
+from generate_data import SCALES, generate  # noqa: E402
+from mongo_data.load_to_mongo import MONGO_URI, STATS_LEDGER, get_database  # noqa: E402
+from transform_load import DB_CONFIG  # noqa: E402
+
+LOADERS = {
+    "transform_load": [os.path.join(ETL_DIR, "transform_load.py")],
+    "load_to_mongo": [os.path.join(ETL_DIR, "mongo_data", "load_to_mongo.py")],
+    "load_to_cassandra": [os.path.join(ETL_DIR, "cassandra_data", "load_to_cassandra.py")],
+}
+
+MYSQL_TABLES = [
+    "AdEvents",
+    "UserInterests",
+    "CampaignInterests",
+    "Campaigns",
+    "Users",
+    "Interests",
+    "Locations",
+    "Advertisers",
+    "EtlManifest",
+]
+
+MONGO_COLLECTIONS = ["users", "user_sessions", "impressions", "user_campaign_stats", STATS_LEDGER]
+
+CASSANDRA_TABLES = [
+    "campaign_daily_performance",
+    "advertiser_daily_spend",
+    "user_engagement_history",
+    "user_clicks_daily",
+    "advertiser_region_spend",
+    "campaign_daily_deltas",
+    "campaign_daily_totals",
+    "advertiser_daily_spend_deltas",
+    "advertiser_daily_spend_totals",
+    "user_clicks_daily_deltas",
+    "user_clicks_daily_totals",
+    "etl_load_watermark",
+]
+
+
+def process_tree_rss_mb(pid):
+    """RSS процесу та всіх його нащадків (воркери пулу) з /proc"""
+    parents = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss[int(entry)] = int(line.split()[1])
+                        break
+        except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+            continue
+
+    tree = {pid}
+    changed = True
+    while changed:
+        changed = False
+        for child, parent in parents.items():
+            if parent in tree and child not in tree:
+                tree.add(child)
+                changed = True
+    return sum(rss.get(p, 0) for p in tree) / 1024
+
+
+def run_loader(name, args, env, interval):
+    """Запускає завантажувач і кожні interval секунд записує RSS"""
+    curve = []
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, *LOADERS[name], *args], env=env)
+
+    def sample():
+        while process.poll() is None:
+            curve.append((round(time.perf_counter() - start, 2), round(process_tree_rss_mb(process.pid), 1)))
+            time.sleep(interval)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    returncode = process.wait()
+    sampler.join()
+    wall_time = time.perf_counter() - start
+
+    return {
+        "loader": name,
+        "returncode": returncode,
+        "wall_time": round(wall_time, 2),
+        "peak_rss_mb": max((rss for _, rss in curve), default=None),
+        "rss_curve": curve,
+    }
+
+
+def reset_mysql():
+    conn = mysql.connector.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in MYSQL_TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cursor.close()
+    conn.close()
+
+
+def reset_mongo():
+    client = MongoClient(MONGO_URI)
+    db = get_database(client, None)
+    for name in MONGO_COLLECTIONS:
+        db[name].drop()
+    client.close()
+
+
+def reset_cassandra(staging_dir):
+    """Таблиці і список оброблених партицій staging: інакше повторний запуск нічого не завантажить"""
+    client = CassandraClient()
+    for table in CASSANDRA_TABLES:
+        client.session.execute(f"TRUNCATE {table}")
+    client.cluster.shutdown()
+    staging.save_processed("load_to_cassandra", {}, staging_dir)
+
+
+# сховища, в які пише кожен завантажувач
+RESETS = {
+    "transform_load": lambda staging_dir: reset_mysql(),
+    "load_to_mongo": lambda staging_dir: reset_mongo(),
+    "load_to_cassandra": reset_cassandra,
+}
+
+
+def read_run_report(report_dir):
+    """JSON-звіт, який завантажувач записав через etl_metrics"""
+    reports = sorted(f for f in os.listdir(report_dir) if f.endswith(".json")) if os.path.isdir(report_dir) else []
+    if not reports:
+        return None
+    with open(os.path.join(report_dir, reports[-1])) as f:
+        return json.load(f)
+
+
+def run_scale(scale, events, data_root, results_dir, loaders, transform_args, interval):
+    data_dir = os.path.join(data_root, scale)
+    events_csv = os.path.join(data_dir, "ad_events.csv")
+    if not os.path.exists(events_csv):
+        print(f"Generating {scale} dataset in {data_dir}")
+        generate(data_dir, events)
+
+    # кожен масштаб починається з порожніх сховищ вибраних завантажувачів і без кешу вимірів. Скидання - до
+    # першого завантажувача, а не перед кожним: load_to_mongo і load_to_cassandra читають те, що записав
+    # transform_load
+    cache_path = os.path.join(data_dir, "dimension_cache.sqlite")
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    staging_dir = os.environ.get("ETL_STAGING_DIR", os.path.join(data_dir, "staging"))
+    for name in loaders:
+        RESETS[name](staging_dir)
+
+    results = []
+    for name in loaders:
+        report_dir = os.path.join(results_dir, scale, name)
+        env = {
+            **os.environ,
+            "ETL_DATA_DIR": data_dir,
+            "ETL_EVENTS_CSV": events_csv,
+            "ETL_REPORT_DIR": report_dir,
+            "DIMENSION_CACHE_PATH": cache_path,
+        }
+        args = ["--events", events_csv, *transform_args] if name == "transform_load" else []
+
+        print(f"[{scale}] running {name}")
+        result = run_loader(name, args, env, interval)
+        result["scale"] = scale
+        result["events"] = events
+        result["events_per_sec"] = round(events / result["wall_time"], 1)
+        result["run_report"] = read_run_report(report_dir)
+        results.append(result)
+        print(
+            f"[{scale}] {name}: {result['wall_time']}s, {result['events_per_sec']:,.0f} events/sec, "
+            f"peak RSS {result['peak_rss_mb']} MB, exit code {result['returncode']}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=["1m"])
+    parser.add_argument("--loaders", nargs="+", choices=LOADERS, default=list(LOADERS))
+    parser.add_argument("--data-dir", default="/data/bench", help="Where generated datasets are kept")
+    parser.add_argument("--results-dir", default=os.path.join(ETL_DIR, "benchmarks", "results"))
+    parser.add_argument(
+        "--transform-args",
+        default="--chunk-size 100000",
+        help="Extra arguments for transform_load.py, e.g. '--chunk-size 500000 --bulk --workers 4'",
+    )
+    parser.add_argument("--interval", type=float, default=0.5, help="RSS sampling interval, seconds")
+    args = parser.parse_args()
+
+    started_at = datetime.now()
+    results = []
+    for scale in args.scales:
+        results.extend(
+            run_scale(
+                scale,
+                SCALES[scale],
+                args.data_dir,
+                args.results_dir,
+                args.loaders,
+                args.transform_args.split(),
+                args.interval,
+            )
+        )
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"benchmark_{started_at:%Y%m%d_%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump({"started_at": started_at.isoformat(), "results": results}, f, indent=2)
+    print(f"Benchmark results saved to {path}")
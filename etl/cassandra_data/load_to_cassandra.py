@@ -1,12 +1,43 @@
 # load_to_cassandra.py
+import argparse
 import logging
 import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict, deque
 from datetime import datetime
+from decimal import Decimal
 
 import mysql.connector
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
+from cassandra.query import BatchStatement, BatchType
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dimension_cache import DimensionCache
+from etl_metrics import RunReport
+import staging
+
+
+# рядків за один fetchmany при потоковому читанні AdEvents
+EVENT_STREAM_BATCH = 10000
+
+# інкрементальний режим: LoadSeq останньої врахованої події в etl_load_watermark
+WATERMARK_NAME = "ad_events"
+# прирост -> (таблиця приростів пакетів, ключ, значення, таблиця підсумків)
+ROLLUPS = {
+    "campaign": (
+        "campaign_daily_deltas", ("campaign_id", "event_date"), ("impressions", "clicks"), "campaign_daily_totals"
+    ),
+    "advertiser": (
+        "advertiser_daily_spend_deltas", ("spend_date", "advertiser_id"), ("spend_cents",),
+        "advertiser_daily_spend_totals",
+    ),
+    "user": ("user_clicks_daily_deltas", ("click_date", "user_id"), ("clicks",), "user_clicks_daily_totals"),
+}
 
 # --- Logging setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -37,108 +68,630 @@ class CassandraClient:
         self.session = self.cluster.connect(os.environ.get("CASSANDRA_KEYSPACE", "ad_analytics"))
 
 
+class CassandraWriter:
+    """Асинхронні записи підготовленими запитами (CQL парситься сервером один раз).
+    В польоті не більше concurrency запитів: коли всі слоти зайняті, write() чекає (backpressure).
+    Невдалі записи повторюються до retries разів з головного потоку, з паузою, що зростає.
+    batch_size > 1: рядки однієї партиції збираються в UNLOGGED batch - один запит на партицію"""
+
+    def __init__(self, session, report, concurrency=128, batch_size=1, retries=3, retry_delay=0.5):
+        self.session = session
+        self.report = report
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.prepared = {}
+        self.slots = threading.Semaphore(concurrency)
+        self.lock = threading.Condition()
+        self.in_flight = 0
+        # (statement, кількість рядків, спроба) - заповнюється з потоків драйвера
+        self.failed = queue.SimpleQueue()
+        self.errors = []
+        # (запит, ключ партиції) -> параметри рядків, ще не відправлені batch-ем
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+
+    def prepare(self, query):
+        statement = self.prepared.get(query)
+        if statement is None:
+            statement = self.prepared[query] = self.session.prepare(query)
+            self.report.add(round_trips=1)
+        return statement
+
+    def write(self, query, params, partition=None):
+        """partition - значення ключа партиції рядка; без нього рядок пишеться окремим запитом"""
+        statement = self.prepare(query)
+        if self.batch_size <= 1 or partition is None:
+            self._submit(statement.bind(params), 1)
+            return
+
+        key = (query, partition)
+        self.buffers[key].append(params)
+        self.buffered += 1
+        if len(self.buffers[key]) >= self.batch_size:
+            self._send_batch(key)
+        elif self.buffered >= self.batch_size * self.concurrency:
+            # пам'ять обмежена: неповні batch-і відправляються як є
+            for key in list(self.buffers):
+                self._send_batch(key)
+
+    def _send_batch(self, key):
+        rows = self.buffers.pop(key)
+        self.buffered -= len(rows)
+        statement = self.prepared[key[0]]
+        if len(rows) == 1:
+            self._submit(statement.bind(rows[0]), 1)
+            return
+        batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+        for params in rows:
+            batch.add(statement, params)
+        self._submit(batch, len(rows))
+
+    def _submit(self, statement, rows, attempt=0):
+        self._retry_failed()
+        self._execute(statement, rows, attempt)
+
+    def _execute(self, statement, rows, attempt):
+        with self.report.current.phase("write"):
+            self.slots.acquire()
+        with self.lock:
+            self.in_flight += 1
+        self.report.add(round_trips=1)
+        future = self.session.execute_async(statement)
+        future.add_callbacks(
+            self._on_success, self._on_error, callback_args=(rows,), errback_args=(statement, rows, attempt)
+        )
+
+    def _on_success(self, _, rows):
+        self.report.add(rows_written=rows)
+        self._release()
+
+    def _on_error(self, err, statement, rows, attempt):
+        if attempt < self.retries:
+            self.failed.put((statement, rows, attempt + 1))
+        else:
+            self.errors.append(err)
+        self._release()
+
+    def _release(self):
+        self.slots.release()
+        with self.lock:
+            self.in_flight -= 1
+            self.lock.notify_all()
+
+    def _retry_failed(self):
+        while not self.failed.empty():
+            statement, rows, attempt = self.failed.get()
+            logging.warning("Retrying write of %d rows (attempt %d)", rows, attempt)
+            with self.report.current.phase("write"):
+                time.sleep(self.retry_delay * attempt)
+            self._execute(statement, rows, attempt)
+
+    def flush(self):
+        """Відправляє неповні batch-і і чекає завершення всіх записів (з повторами)"""
+        for key in list(self.buffers):
+            self._send_batch(key)
+        while True:
+            self._retry_failed()
+            with self.report.current.phase("write"), self.lock:
+                while self.in_flight and self.failed.empty():
+                    self.lock.wait()
+                if not self.in_flight and self.failed.empty():
+                    break
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise RuntimeError(f"{len(errors)} writes failed after {self.retries} retries, first error: {errors[0]}")
+
+
 class ETLLoader:
-    def __init__(self, mysql_client, cassandra_client):
+    def __init__(
+        self,
+        mysql_client,
+        cassandra_client,
+        report=None,
+        staged=False,
+        concurrency=128,
+        batch_size=1,
+        retries=3,
+        history_ttl=0,
+    ):
+        self.report = report or RunReport("load_to_cassandra")
         self.mysql = mysql_client
-        self.cassandra = cassandra_client.session
+        self.mysql.cursor = self.report.track(mysql_client.cursor, {"execute"})
+        self.cassandra = CassandraWriter(
+            cassandra_client.session, self.report, concurrency=concurrency, batch_size=batch_size, retries=retries
+        )
+        # кампанія -> рекламодавець / регіон береться з кешу довідників замість JOIN у кожному запиті
+        self.dimensions = DimensionCache()
+        self.dimensions.sync(mysql_client.conn)
+        self.history_ttl = history_ttl
 
-    def load_campaign_daily_performance(self):
-        logging.info("Loading campaign_daily_performance")
+        # staged: події читаються з партицій Parquet замість AdEvents. Кожна партиція - один повний день,
+        # тому денні агрегати рахуються по одній партиції, а вже оброблені партиції пропускаються
+        self.staged = staged
+        self.partitions = []
+        if staged:
+            self.processed = staging.load_processed("load_to_cassandra")
+            self.partitions = staging.pending_partitions(staging.list_partitions(), self.processed)
+            self.fingerprints = {
+                os.path.basename(path): staging.partition_fingerprint(path) for _, path in self.partitions
+            }
+            logging.info("Staging partitions to process: %d", len(self.partitions))
+
+    def read_rows(self):
+        """Рядки результату MySQL; час читання йде в parse, кількість - в rows_read"""
+        for row in self.report.current.timed_iter(self.mysql.cursor, "parse"):
+            self.report.add(rows_read=1)
+            yield row
+
+    def write(self, query, params, partition=None):
+        self.cassandra.write(query, params, partition)
+
+    def read_staged_rows(self, columns, keys=None, aggregations=None):
+        """Рядки з партицій staging у тому ж вигляді, що й результат SQL-запиту: з колонкою Day
+        і CampaignID замість CampaignName. aggregations - {назва: (колонка, функція)} для group_by(keys)"""
+        campaign_map = self.dimensions.get_map("Campaigns")
+        for day, path in self.partitions:
+            with self.report.current.phase("parse"):
+                table = staging.read_partition_table(path, columns)
+                self.report.add(rows_read=table.num_rows)
+                if keys:
+                    table = table.group_by(keys).aggregate(list(aggregations.values()))
+                    names = {f"{column}_{func}": alias for alias, (column, func) in aggregations.items()}
+                    table = table.rename_columns([names.get(name, name) for name in table.column_names])
+                rows = table.to_pylist()
+
+            for row in rows:
+                row["Day"] = day
+                if "CampaignName" in row:
+                    row["CampaignID"] = campaign_map.get(row.pop("CampaignName"))
+                    if row["CampaignID"] is None:
+                        continue
+                yield row
+
+    def fetch_campaign_daily_spend(self):
+        if self.staged:
+            return self.read_staged_rows(
+                ["CampaignName", "AdCost"], ["CampaignName"], {"total_spend": ("AdCost", "sum")}
+            )
         self.mysql.cursor.execute("""
             SELECT CampaignID, DATE(Timestamp) as Day,
-                COUNT(*) as impressions,
-                SUM(WasClicked) as clicks
+                   SUM(AdCost) as total_spend
             FROM AdEvents
             GROUP BY CampaignID, Day
         """)
-        for row in self.mysql.cursor:
-            impressions = int(row['impressions'] or 0)
-            clicks = int(row['clicks'] or 0)
-            ctr = (clicks / impressions * 100) if impressions else 0.0
-
-            self.cassandra.execute("""
-                INSERT INTO campaign_daily_performance (
-                    campaign_id, event_date, impressions, clicks, ctr
-                ) VALUES (%s, %s, %s, %s, %s)
-            """, (
-                int(row['CampaignID']),
-                row['Day'],
-                impressions,
-                clicks,
-                ctr
-            ))
+        return self.read_rows()
 
-    def load_advertiser_daily_spend(self):
-        logging.info("Loading advertiser_daily_spend")
+    def fetch_campaign_daily_performance(self):
+        if self.staged:
+            return self.read_staged_rows(
+                ["CampaignName", "EventID", "WasClicked"],
+                ["CampaignName"],
+                {"impressions": ("EventID", "count"), "clicks": ("WasClicked", "sum")},
+            )
         self.mysql.cursor.execute("""
-            SELECT c.AdvertiserID, DATE(e.Timestamp) as Day,
-                   SUM(e.AdCost) as total_spend
-            FROM AdEvents e
-            JOIN Campaigns c ON e.CampaignID = c.CampaignID
-            GROUP BY c.AdvertiserID, Day
+            SELECT CampaignID, DATE(Timestamp) as Day,
+                COUNT(*) as impressions,
+                SUM(WasClicked) as clicks
+            FROM AdEvents
+            GROUP BY CampaignID, Day
         """)
-        for row in self.mysql.cursor:
-            self.cassandra.execute("""
-                INSERT INTO advertiser_daily_spend (advertiser_id, spend_date, total_spend)
-                VALUES (%s, %s, %s)
-            """, (row['AdvertiserID'], row['Day'], row['total_spend']))
+        return self.read_rows()
 
-    def load_user_engagement_history(self):
-        logging.info("Loading user_engagement_history")
+    def fetch_user_events(self):
+        if self.staged:
+            return self.read_staged_rows(["EventID", "UserID", "CampaignName", "Timestamp", "WasClicked"])
         self.mysql.cursor.execute("""
-            SELECT UserID, CampaignID, Timestamp, WasClicked
+            SELECT EventID, UserID, CampaignID, Timestamp, WasClicked
             FROM AdEvents
         """)
-        for row in self.mysql.cursor:
-            self.cassandra.execute("""
-                INSERT INTO user_engagement_history (user_id, event_time, campaign_id, ad_clicked)
-                VALUES (%s, %s, %s, %s)
-            """, (row['UserID'], row['Timestamp'], row['CampaignID'], bool(row['WasClicked'])))
+        return self.read_rows()
 
-    def load_user_clicks_daily(self):
-        logging.info("Loading user_clicks_daily")
+    def fetch_user_clicks_daily(self):
+        if self.staged:
+            return self.read_staged_rows(["UserID", "WasClicked"], ["UserID"], {"clicks": ("WasClicked", "sum")})
         self.mysql.cursor.execute("""
             SELECT UserID, DATE(Timestamp) as Day,
                    SUM(WasClicked) as clicks
             FROM AdEvents
             GROUP BY UserID, Day
         """)
-        for row in self.mysql.cursor:
-            self.cassandra.execute("""
-                INSERT INTO user_clicks_daily (click_date, user_id, clicks)
-                VALUES (%s, %s, %s)
-            """, (row['Day'], row['UserID'], int(row['clicks'])))
+        return self.read_rows()
+
+    def fetch_event_stream(self):
+        """Всі події одним проходом в порядку часу: (EventID, UserID, CampaignID, Timestamp, WasClicked, AdCost).
+        З MySQL - небуферизованим курсором (рядки читаються з сокета частинами по fetchmany, а не всім
+        результатом в пам'ять клієнта); зі staging - кожна денна партиція читається один раз"""
+        if self.staged:
+            columns = ["EventID", "UserID", "CampaignName", "Timestamp", "WasClicked", "AdCost"]
+            for row in self.read_staged_rows(columns):
+                if row['Timestamp'] is None:
+                    continue
+                yield (
+                    row['EventID'], row['UserID'], row['CampaignID'], row['Timestamp'], row['WasClicked'], row['AdCost']
+                )
+            return
+
+        # ORDER BY Timestamp (індекс idx_timestamp): події приходять по днях, тому денні агрегати
+        # можна записати і звільнити, щойно почався наступний день
+        cursor = self.report.track(self.mysql.conn.cursor(buffered=False), {"execute"})
+        cursor.execute("""
+            SELECT EventID, UserID, CampaignID, Timestamp, WasClicked, AdCost
+            FROM AdEvents
+            WHERE Timestamp IS NOT NULL
+            ORDER BY Timestamp
+        """)
+        batches = self.report.current.timed_iter(iter(lambda: cursor.fetchmany(EVENT_STREAM_BATCH), []), "parse")
+        try:
+            for rows in batches:
+                self.report.add(rows_read=len(rows))
+                yield from rows
+        finally:
+            cursor.close()
+
+    def write_campaign_daily_performance(self, campaign_id, day, impressions, clicks):
+        ctr = (clicks / impressions * 100) if impressions else 0.0
+        self.write("""
+            INSERT INTO campaign_daily_performance (
+                campaign_id, event_date, impressions, clicks, ctr
+            ) VALUES (?, ?, ?, ?, ?)
+        """, (campaign_id, day, impressions, clicks, ctr), partition=campaign_id)
+
+    def write_advertiser_daily_spend(self, spend):
+        """spend: {(AdvertiserID, день): сума}"""
+        for (advertiser_id, day), total_spend in spend.items():
+            self.write("""
+                INSERT INTO advertiser_daily_spend (advertiser_id, spend_date, total_spend)
+                VALUES (?, ?, ?)
+            """, (advertiser_id, day, total_spend), partition=day)
+
+    def write_user_engagement(self, event_id, user_id, event_time, campaign_id, clicked):
+        """Партиція - (користувач, місяць), EventID розрізняє події з однаковим часом.
+        TTL 0 - без терміну зберігання"""
+        month = f"{event_time:%Y-%m}"
+        self.write("""
+            INSERT INTO user_engagement_history (user_id, month, event_time, event_id, campaign_id, ad_clicked)
+            VALUES (?, ?, ?, ?, ?, ?)
+            USING TTL ?
+        """, (
+            user_id, month, event_time, event_id, campaign_id, bool(clicked), self.history_ttl
+        ), partition=(user_id, month))
+
+    def write_user_clicks_daily(self, day, user_id, clicks):
+        self.write("""
+            INSERT INTO user_clicks_daily (click_date, user_id, clicks)
+            VALUES (?, ?, ?)
+        """, (day, user_id, clicks), partition=day)
+
+    def write_advertiser_region_spend(self, spend):
+        """spend: {(регіон, AdvertiserID, день): сума}"""
+        for (region, advertiser_id, day), total_spend in spend.items():
+            self.write("""
+                INSERT INTO advertiser_region_spend (region_name, spend_date, advertiser_id, total_spend)
+                VALUES (?, ?, ?, ?)
+            """, (region, day, advertiser_id, total_spend), partition=(region, day))
+
+    def campaign_owners(self):
+        """CampaignID -> (AdvertiserID, регіон таргетингу) з кешу довідників; None, якщо невідомо"""
+        locations = self.dimensions.get_rows("Locations")
+        owners = {}
+        for campaign_id, campaign in self.dimensions.get_rows("Campaigns").items():
+            location = locations.get(campaign['TargetingLocationID'])
+            owners[campaign_id] = (campaign['AdvertiserID'], location['LocationName'] if location else None)
+        return owners
+
+    def load_campaign_daily_performance(self):
+        logging.info("Loading campaign_daily_performance")
+        for row in self.fetch_campaign_daily_performance():
+            self.write_campaign_daily_performance(
+                int(row['CampaignID']), row['Day'], int(row['impressions'] or 0), int(row['clicks'] or 0)
+            )
+
+    def load_advertiser_daily_spend(self):
+        logging.info("Loading advertiser_daily_spend")
+        owners = self.campaign_owners()
+        spend = defaultdict(Decimal)
+        for row in self.fetch_campaign_daily_spend():
+            advertiser_id, _ = owners.get(row['CampaignID'], (None, None))
+            if advertiser_id is None:
+                continue
+            spend[(advertiser_id, row['Day'])] += row['total_spend']
+        self.write_advertiser_daily_spend(spend)
+
+    def load_user_engagement_history(self):
+        logging.info("Loading user_engagement_history")
+        for row in self.fetch_user_events():
+            if row['Timestamp'] is None:
+                continue
+            self.write_user_engagement(
+                row['EventID'], row['UserID'], row['Timestamp'], row['CampaignID'], row['WasClicked']
+            )
+
+    def load_user_clicks_daily(self):
+        logging.info("Loading user_clicks_daily")
+        for row in self.fetch_user_clicks_daily():
+            self.write_user_clicks_daily(row['Day'], row['UserID'], int(row['clicks']))
 
     def load_advertiser_region_spend(self):
         logging.info("Loading advertiser_region_spend")
-        self.mysql.cursor.execute("""
-            SELECT l.LocationName as Region, c.AdvertiserID, DATE(e.Timestamp) as Day,
-                   SUM(e.AdCost) as total_spend
-            FROM AdEvents e
-            JOIN Campaigns c ON e.CampaignID = c.CampaignID
-            JOIN Locations l ON c.TargetingLocationID = l.LocationID
-            GROUP BY Region, c.AdvertiserID, Day
+        owners = self.campaign_owners()
+        spend = defaultdict(Decimal)
+        for row in self.fetch_campaign_daily_spend():
+            advertiser_id, region = owners.get(row['CampaignID'], (None, None))
+            if advertiser_id is None or region is None:
+                continue
+            spend[(region, advertiser_id, row['Day'])] += row['total_spend']
+        self.write_advertiser_region_spend(spend)
+
+    def load_single_scan(self):
+        """Всі п'ять таблиць за один прохід по подіях замість п'яти запитів до AdEvents.
+        user_engagement_history пишеться по мірі читання, решта - часткові агрегати поточного дня,
+        які записуються і звільняються при переході до наступного дня: пам'ять обмежена одним днем"""
+        logging.info("Loading all tables in a single scan of events")
+        owners = self.campaign_owners()
+        day = None
+
+        def flush_day():
+            advertiser_spend = defaultdict(Decimal)
+            region_spend = defaultdict(Decimal)
+            for campaign_id, (impressions, clicks, spend) in performance.items():
+                self.write_campaign_daily_performance(campaign_id, day, impressions, clicks)
+                advertiser_id, region = owners.get(campaign_id, (None, None))
+                if advertiser_id is None:
+                    continue
+                advertiser_spend[(advertiser_id, day)] += spend
+                if region is not None:
+                    region_spend[(region, advertiser_id, day)] += spend
+            self.write_advertiser_daily_spend(advertiser_spend)
+            self.write_advertiser_region_spend(region_spend)
+            for user_id, clicks in user_clicks.items():
+                self.write_user_clicks_daily(day, user_id, clicks)
+
+        # CampaignID -> [покази, кліки, витрати] і UserID -> кліки за поточний день
+        performance = defaultdict(lambda: [0, 0, Decimal(0)])
+        user_clicks = defaultdict(int)
+        for event_id, user_id, campaign_id, timestamp, clicked, cost in self.fetch_event_stream():
+            if timestamp.date() != day:
+                if day is not None:
+                    flush_day()
+                day = timestamp.date()
+                performance.clear()
+                user_clicks.clear()
+
+            self.write_user_engagement(event_id, user_id, timestamp, campaign_id, clicked)
+            totals = performance[campaign_id]
+            totals[0] += 1
+            totals[1] += int(clicked)
+            totals[2] += cost or 0
+            user_clicks[user_id] += int(clicked)
+
+        if day is not None:
+            flush_day()
+
+    # ------------- Incremental rollups ----------------
+
+    def read_watermark(self):
+        """(LoadSeq останньої врахованої події, LoadSeq кінця незавершеного пакета або None)"""
+        row = self.cassandra.session.execute("""
+            SELECT last_seq, pending_seq FROM etl_load_watermark WHERE name = %s
+        """, (WATERMARK_NAME,)).one()
+        self.report.add(round_trips=1)
+        if row is None:
+            return 0, None
+        return row.last_seq, row.pending_seq
+
+    def save_watermark(self, last, pending=None):
+        self.cassandra.session.execute("""
+            INSERT INTO etl_load_watermark (name, last_seq, pending_seq) VALUES (%s, %s, %s)
+        """, (WATERMARK_NAME, last, pending))
+        self.report.add(round_trips=1)
+
+    def committed_load_seq(self):
+        """LoadSeq, до якого всі рядки AdEvents закомічені: transform_load.py записує його в EtlManifest
+        у тій самій транзакції, що й дані. Рядки з більшим LoadSeq можуть належати ще відкритій транзакції"""
+        cursor = self.report.track(self.mysql.conn.cursor(), {"execute"})
+        cursor.execute("SELECT MAX(LoadSeq) FROM EtlManifest")
+        (load_seq,) = cursor.fetchone()
+        cursor.close()
+        return load_seq or 0
+
+    def fetch_events_after(self, after, until=None, limit=None):
+        """Події з LoadSeq в (after, until] в порядку завантаження - за унікальним індексом idx_load_seq.
+        LoadSeq росте з кожним вставленим рядком незалежно від Timestamp, тому подія зі старим часом,
+        дописана пізніше, все одно потрапляє в наступний пакет"""
+        query = """
+            SELECT EventID, UserID, CampaignID, Timestamp, WasClicked, AdCost, LoadSeq
+            FROM AdEvents
+            WHERE LoadSeq > %s AND Timestamp IS NOT NULL
+        """
+        params = [after]
+        if until is not None:
+            query += " AND LoadSeq <= %s"
+            params.append(until)
+        query += " ORDER BY LoadSeq"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        cursor = self.report.track(self.mysql.conn.cursor(), {"execute"})
+        cursor.execute(query, params)
+        with self.report.current.phase("parse"):
+            rows = cursor.fetchall()
+        cursor.close()
+        self.report.add(rows_read=len(rows))
+        return rows
+
+    def write_totals(self, rollup, keys):
+        """Підсумок кожного ключа - сума його приростів за всі пакети (одна партиція таблиці приростів),
+        записана як значення, а не інкремент: повторний перерахунок дає той самий результат"""
+        deltas_table, key_columns, value_columns, totals_table = ROLLUPS[rollup]
+        select = self.cassandra.prepare(f"""
+            SELECT {", ".join(f"sum({column})" for column in value_columns)} FROM {deltas_table}
+            WHERE {" AND ".join(f"{column} = ?" for column in key_columns)}
         """)
-        for row in self.mysql.cursor:
-            self.cassandra.execute("""
-                INSERT INTO advertiser_region_spend (region_name, spend_date, advertiser_id, total_spend)
-                VALUES (%s, %s, %s, %s)
-            """, (row['Region'], row['Day'], row['AdvertiserID'], row['total_spend']))
+        columns = [*key_columns, *value_columns]
+        insert = f"""
+            INSERT INTO {totals_table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})
+        """
+
+        # читання по concurrency одночасно, записи підсумків - через CassandraWriter
+        pending = deque()
+
+        def write_next():
+            key, future = pending.popleft()
+            with self.report.current.phase("write"):
+                totals = tuple(future.result().one())
+            self.write(insert, (*key, *totals), partition=key[0])
+
+        for key in keys:
+            pending.append((key, self.cassandra.session.execute_async(select, key)))
+            self.report.add(round_trips=1)
+            if len(pending) >= self.cassandra.concurrency:
+                write_next()
+        while pending:
+            write_next()
+
+    def apply_deltas(self, batch_id, rows):
+        """Пакет подій -> прирости ключів, записані з batch_id у таблиці приростів, і перераховані підсумки
+        цих ключів. Обидва кроки ідемпотентні (звичайні INSERT, без COUNTER), тому пакет, перерваний
+        на будь-якому кроці, при повторі з тими самими межами дає точно ті самі підсумки"""
+        owners = self.campaign_owners()
+        deltas = {
+            # (campaign_id, день) -> [покази, кліки]
+            "campaign": defaultdict(lambda: [0, 0]),
+            # (день, advertiser_id) -> [витрати в центах]
+            "advertiser": defaultdict(lambda: [0]),
+            # (день, user_id) -> [кліки]
+            "user": defaultdict(lambda: [0]),
+        }
+        with self.report.current.phase("transform"):
+            for _, user_id, campaign_id, timestamp, clicked, cost, _ in rows:
+                day = timestamp.date()
+                totals = deltas["campaign"][(campaign_id, day)]
+                totals[0] += 1
+                totals[1] += int(clicked)
+                advertiser_id, _ = owners.get(campaign_id, (None, None))
+                if advertiser_id is not None and cost:
+                    # лічильники цілі: витрати в центах
+                    deltas["advertiser"][(day, advertiser_id)][0] += int(cost * 100)
+                if clicked:
+                    deltas["user"][(day, user_id)][0] += 1
+
+        for rollup, keys in deltas.items():
+            deltas_table, key_columns, value_columns, _ = ROLLUPS[rollup]
+            columns = [*key_columns, "batch_id", *value_columns]
+            insert = f"""
+                INSERT INTO {deltas_table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})
+            """
+            for key, values in keys.items():
+                self.write(insert, (*key, batch_id, *values), partition=key)
+        # підсумки читають прирости цього пакета, тому рахуються тільки після їх підтвердження
+        self.cassandra.flush()
 
-    def run_all(self):
+        for rollup, keys in deltas.items():
+            self.write_totals(rollup, keys)
+
+        # історія показів - звичайні INSERT, повтор їх просто перезаписує
+        for event_id, user_id, campaign_id, timestamp, clicked, _, _ in rows:
+            self.write_user_engagement(event_id, user_id, timestamp, campaign_id, clicked)
+        self.cassandra.flush()
+
+    def load_incremental(self, batch_rows=100000):
+        """Тільки події після watermark, пакетами по batch_rows в порядку LoadSeq. Кінець пакета (він же
+        batch_id) записується до застосування, а watermark зсувається після: після збою незавершений
+        пакет читається заново з тими самими межами і застосовується ще раз.
+        LoadSeq видається при вставці, а не при коміті, тому читання обмежене committed_load_seq():
+        запуск під час завантаження transform_load.py не пропускає рядки ще не закомічених транзакцій,
+        а забирає їх наступним запуском"""
+        committed = self.committed_load_seq()
+        last, pending = self.read_watermark()
+        if pending is not None:
+            logging.info("Replaying unfinished batch up to LoadSeq %s", pending)
+            self.apply_deltas(pending, self.fetch_events_after(last, pending))
+            last = pending
+            self.save_watermark(last)
+
+        while rows := self.fetch_events_after(last, committed, limit=batch_rows):
+            pending = rows[-1][6]
+            self.save_watermark(last, pending)
+            self.apply_deltas(pending, rows)
+            last = pending
+            self.save_watermark(last)
+            logging.info("Applied %d new events, watermark LoadSeq %s", len(rows), last)
+
+    def run_all(self, single_scan=False, incremental=False, batch_rows=100000):
+        stages = [
+            ("campaign_daily_performance", self.load_campaign_daily_performance),
+            ("advertiser_daily_spend", self.load_advertiser_daily_spend),
+            ("user_engagement_history", self.load_user_engagement_history),
+            ("user_clicks_daily", self.load_user_clicks_daily),
+            ("advertiser_region_spend", self.load_advertiser_region_spend),
+        ]
+        if single_scan:
+            stages = [("single_scan", self.load_single_scan)]
+        if incremental:
+            stages = [("incremental", lambda: self.load_incremental(batch_rows))]
         try:
-            self.load_campaign_daily_performance()
-            self.load_advertiser_daily_spend()
-            self.load_user_engagement_history()
-            self.load_user_clicks_daily()
-            self.load_advertiser_region_spend()
+            for name, load in stages:
+                with self.report.stage(name):
+                    load()
+                    self.cassandra.flush()
+            if self.staged:
+                # партиції позначаються обробленими тільки після всіх таблиць
+                self.processed.update(self.fingerprints)
+                staging.save_processed("load_to_cassandra", self.processed)
             logging.info("ETL load to Cassandra complete.")
         except Exception as e:
             logging.exception("ETL failed: %s", e)
+        finally:
+            self.report.save()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--staged",
+        help="Read events from the Parquet staging layer instead of MySQL; already processed partitions are skipped",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--single-scan",
+        help="Compute all tables in one ordered pass over events instead of one query per table",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Apply only events loaded after the stored watermark to the daily totals (and user_engagement_history)",
+        action="store_true",
+    )
+    parser.add_argument("--batch-rows", help="Events per incremental batch", type=int, default=100000)
+    parser.add_argument(
+        "--history-ttl",
+        help="TTL of user_engagement_history rows in seconds (0 - keep forever)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument("--concurrency", help="Maximum number of in-flight Cassandra writes", type=int, default=128)
+    parser.add_argument(
+        "--batch-size",
+        help="Group up to N rows of the same partition into one UNLOGGED batch (1 - no batching)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument("--retries", help="Retries of a failed write before the stage fails", type=int, default=3)
+    args = parser.parse_args()
+    if args.incremental and (args.staged or args.single_scan):
+        parser.error("--incremental reads AdEvents directly and cannot be combined with --staged or --single-scan")
+
     mysql_client = MySQLClient()
     cassandra_client = CassandraClient()
-    loader = ETLLoader(mysql_client, cassandra_client)
-    loader.run_all()
+    loader = ETLLoader(
+        mysql_client,
+        cassandra_client,
+        staged=args.staged,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        history_ttl=args.history_ttl,
+    )
+    loader.run_all(single_scan=args.single_scan, incremental=args.incremental, batch_rows=args.batch_rows)
@@ -1,17 +1,47 @@
 # run_queries.py
 import os
+import heapq
 import logging
 import argparse
+import shutil
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from cassandra.cluster import Cluster
 from cassandra.auth import PlainTextAuthProvider
 
+# скільки денних партицій читається одночасно
+DAY_CONCURRENCY = 32
+# історія користувача: скільки місячних партицій назад переглядати і скільки читати одночасно
+HISTORY_MONTHS = 36
+HISTORY_WINDOW = 3
+# межі токенів Murmur3Partitioner
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
 # --- Logging setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def token_ranges(splits):
+    """Кільце токенів, розбите на splits рівних діапазонів (start, end]"""
+    step = (MAX_TOKEN - MIN_TOKEN) // splits
+    bounds = [MIN_TOKEN + step * i for i in range(splits)] + [MAX_TOKEN]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def month_buckets(end_date, count):
+    """Місяці 'YYYY-MM' від місяця end_date назад, від найновішого"""
+    year, month = end_date.year, end_date.month
+    buckets = []
+    for _ in range(count):
+        buckets.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return buckets
+
+
 class CassandraQueryRunner:
-    def __init__(self):
+    def __init__(self, scan_splits=64, scan_workers=8, fetch_size=5000, totals=False):
         auth_provider = PlainTextAuthProvider(
             username=os.environ.get("CASSANDRA_USERNAME", "cassandra"),
             password=os.environ.get("CASSANDRA_PASSWORD", "cassandra")
@@ -24,75 +54,163 @@ class CassandraQueryRunner:
         self.session = self.cluster.connect(os.environ.get("CASSANDRA_KEYSPACE", "ad_analytics"))
         self.output_dir = "results"
         os.makedirs(self.output_dir, exist_ok=True)
+        self.scan_splits = scan_splits
+        self.scan_workers = scan_workers
+        self.fetch_size = fetch_size
+        # totals: запити 1, 2, 4 читають підсумки (*_totals) інкрементального завантаження
+        self.totals = totals
 
     def save_results(self, name, rows):
-        rows = list(rows)
         path = os.path.join(self.output_dir, f"{name}.txt")
+        count = 0
         with open(path, "w") as f:
             for row in rows:
                 f.write(str(row) + "\n")
-        logging.info(f"Saved {len(rows)} rows to {path}")
+                count += 1
+        logging.info(f"Saved {count} rows to {path}")
+
+    def scan_table(self, name, table, columns, partition_key, row_format=tuple):
+        """Повний скан таблиці паралельно по діапазонах токенів (кожен діапазон - свої координатори і
+        сторінки по fetch_size рядків). Рядки діапазону пишуться у файл частини по мірі отримання; готова
+        частина перейменовується, тому після збою повторний запуск сканує тільки незавершені діапазони.
+        Наприкінці частини склеюються в results/{name}.txt"""
+        ranges = token_ranges(self.scan_splits)
+        parts_dir = os.path.join(self.output_dir, f"{name}.{self.scan_splits}.parts")
+        os.makedirs(parts_dir, exist_ok=True)
+        done = {int(part.split(".")[0]) for part in os.listdir(parts_dir) if part.endswith(".txt")}
+        if done:
+            logging.info(f"Resuming scan of {table}: {len(done)} of {len(ranges)} token ranges already done")
+
+        statement = self.session.prepare(f"""
+            SELECT {", ".join(columns)} FROM {table}
+            WHERE token({partition_key}) > ? AND token({partition_key}) <= ?;
+        """)
+        statement.fetch_size = self.fetch_size
+
+        def scan(index):
+            part = os.path.join(parts_dir, f"{index}.txt")
+            rows = 0
+            with open(part + ".tmp", "w") as f:
+                # наступні сторінки драйвер запитує під час ітерації
+                for row in self.session.execute(statement, ranges[index]):
+                    f.write(str(row_format(row)) + "\n")
+                    rows += 1
+            os.replace(part + ".tmp", part)
+            return rows
+
+        pending = [index for index in range(len(ranges)) if index not in done]
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as pool:
+            scanned = sum(pool.map(scan, pending))
+        logging.info(f"Scanned {scanned} rows of {table} in {len(pending)} token ranges")
+
+        path = os.path.join(self.output_dir, f"{name}.txt")
+        with open(path, "w") as out:
+            for index in range(len(ranges)):
+                with open(os.path.join(parts_dir, f"{index}.txt")) as f:
+                    shutil.copyfileobj(f, out)
+        shutil.rmtree(parts_dir)
+        logging.info(f"Saved {table} scan to {path}")
+
+    def fetch_days(self, query, start, end, params=()):
+        """Рядки денних партицій від start до end включно: query з умовою "... = ?" на день (останній
+        параметр). Запити до партицій виконуються асинхронно, в польоті не більше DAY_CONCURRENCY"""
+        statement = self.session.prepare(query)
+        days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+        pending = deque()
+        for day in days:
+            pending.append(self.session.execute_async(statement, (*params, day)))
+            if len(pending) >= DAY_CONCURRENCY:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    @staticmethod
+    def top_k(rows, k):
+        """rows - пари (ключ, значення) з кількох партицій: сума по ключу і k найбільших через heap"""
+        totals = defaultdict(int)
+        for key, value in rows:
+            totals[key] += value
+        return heapq.nlargest(k, totals.items(), key=lambda item: item[1])
 
     def run_ctr_per_campaign(self):
         logging.info("Running query: CTR per campaign per day")
-        rows = self.session.execute("""
-            SELECT campaign_id, event_date, ctr FROM campaign_daily_performance;
-        """)
-        result = [(r.campaign_id, r.event_date, r.ctr) for r in rows]
-        self.save_results("query1_ctr_per_campaign", result)
-
-    def run_top_advertisers(self, date):
-        logging.info("Running query: Top 5 advertisers by spend since {date}")
-        rows = self.session.execute("""
-            SELECT advertiser_id, spend_date, total_spend FROM advertiser_daily_spend
-            WHERE spend_date >= %s ALLOW FILTERING;
-        """, (date,))
-        spend_map = {}
-        for r in rows:
-            spend_map[r.advertiser_id] = spend_map.get(r.advertiser_id, 0) + float(r.total_spend)
-        top5 = sorted(spend_map.items(), key=lambda x: x[1], reverse=True)[:5]
+        if self.totals:
+            self.scan_table(
+                "query1_ctr_per_campaign",
+                "campaign_daily_totals",
+                ["campaign_id", "event_date", "impressions", "clicks"],
+                "campaign_id",
+                lambda r: (r.campaign_id, r.event_date, (r.clicks / r.impressions * 100) if r.impressions else 0.0),
+            )
+            return
+        self.scan_table(
+            "query1_ctr_per_campaign", "campaign_daily_performance", ["campaign_id", "event_date", "ctr"], "campaign_id"
+        )
+
+    def run_top_advertisers(self, date, end_date):
+        logging.info(f"Running query: Top 5 advertisers by spend from {date} to {end_date}")
+        if self.totals:
+            rows = self.fetch_days("""
+                SELECT advertiser_id, spend_cents FROM advertiser_daily_spend_totals
+                WHERE spend_date = ?;
+            """, date, end_date)
+            spend = ((r.advertiser_id, r.spend_cents / 100) for r in rows)
+        else:
+            rows = self.fetch_days("""
+                SELECT advertiser_id, total_spend FROM advertiser_daily_spend
+                WHERE spend_date = ?;
+            """, date, end_date)
+            spend = ((r.advertiser_id, float(r.total_spend)) for r in rows)
+        top5 = self.top_k(spend, 5)
         self.save_results("query2_top_advertisers", top5)
 
-    def run_user_engagement_history(self, user_id):
-        logging.info(f"Running query: Last 10 ads seen by user {user_id}")
-        rows = self.session.execute("""
+    def run_user_engagement_history(self, user_id, end_date, limit=10):
+        """Місячні партиції від найновішої, по HISTORY_WINDOW одночасно, поки не набереться limit рядків:
+        для активного користувача - одна-дві маленькі партиції незалежно від довжини історії"""
+        logging.info(f"Running query: Last {limit} ads seen by user {user_id}")
+        statement = self.session.prepare("""
             SELECT event_time, campaign_id, ad_clicked FROM user_engagement_history
-            WHERE user_id = %s LIMIT 10;
-        """, (user_id,))
-        result = [(r.event_time, r.campaign_id, r.ad_clicked) for r in rows]
-        self.save_results("query3_user_engagement", result)
-
-    def run_top_users_clicks(self, date):
-        logging.info("Running query: Top 10 users with most clicks since {date}")
-        rows = self.session.execute("""
-            SELECT click_date, user_id, clicks FROM user_clicks_daily
-            WHERE click_date >= %s ALLOW FILTERING;
-        """, (date,))
-        click_map = {}
-        for r in rows:
-            click_map[r.user_id] = click_map.get(r.user_id, 0) + int(r.clicks)
-        top10 = sorted(click_map.items(), key=lambda x: x[1], reverse=True)[:10]
+            WHERE user_id = ? AND month = ? LIMIT ?;
+        """)
+        months = month_buckets(end_date, HISTORY_MONTHS)
+        result = []
+        for start in range(0, len(months), HISTORY_WINDOW):
+            futures = [
+                self.session.execute_async(statement, (user_id, month, limit))
+                for month in months[start:start + HISTORY_WINDOW]
+            ]
+            for future in futures:
+                result.extend((r.event_time, r.campaign_id, r.ad_clicked) for r in future.result())
+            if len(result) >= limit:
+                break
+        self.save_results("query3_user_engagement", result[:limit])
+
+    def run_top_users_clicks(self, date, end_date):
+        logging.info(f"Running query: Top 10 users with most clicks from {date} to {end_date}")
+        table = "user_clicks_daily_totals" if self.totals else "user_clicks_daily"
+        rows = self.fetch_days(f"""
+            SELECT user_id, clicks FROM {table}
+            WHERE click_date = ?;
+        """, date, end_date)
+        top10 = self.top_k(((r.user_id, int(r.clicks)) for r in rows), 10)
         self.save_results("query4_top_users", top10)
 
-    def run_top_advertisers_by_region(self, date, region="USA"):
-        logging.info(f"Running query: Top 5 advertisers in region '{region}' since {date}")
-        rows = self.session.execute("""
-            SELECT region_name, spend_date, advertiser_id, total_spend FROM advertiser_region_spend
-            WHERE region_name = %s AND spend_date >= %s ALLOW FILTERING;
-        """, (region, date))
-        region_spend = {}
-        for r in rows:
-            region_spend[r.advertiser_id] = region_spend.get(r.advertiser_id, 0) + float(r.total_spend)
-        top5_region = sorted(region_spend.items(), key=lambda x: x[1], reverse=True)[:5]
+    def run_top_advertisers_by_region(self, date, end_date, region="USA"):
+        logging.info(f"Running query: Top 5 advertisers in region '{region}' from {date} to {end_date}")
+        rows = self.fetch_days("""
+            SELECT advertiser_id, total_spend FROM advertiser_region_spend
+            WHERE region_name = ? AND spend_date = ?;
+        """, date, end_date, (region,))
+        top5_region = self.top_k(((r.advertiser_id, float(r.total_spend)) for r in rows), 5)
         self.save_results("query5_top_advertisers_usa", top5_region)
 
-    def run_all(self, date):
+    def run_all(self, date, end_date):
         try:
             self.run_ctr_per_campaign()
-            self.run_top_advertisers(date)
-            self.run_user_engagement_history(145276)
-            self.run_top_users_clicks(date)
-            self.run_top_advertisers_by_region(date, "USA")
+            self.run_top_advertisers(date, end_date)
+            self.run_user_engagement_history(145276, end_date)
+            self.run_top_users_clicks(date, end_date)
+            self.run_top_advertisers_by_region(date, end_date, "USA")
             logging.info("All queries executed successfully.")
         except Exception as e:
             logging.exception("Query execution failed: %s", e)
@@ -106,15 +224,34 @@ if __name__ == "__main__":
         help="Date in format YYYY-MM-DD",
         type=str
     )
+    parser.add_argument(
+        "--end-date",
+        help="Last day of the period (inclusive), YYYY-MM-DD. Default: today",
+        type=str
+    )
+    parser.add_argument("--scan-splits", help="Token ranges for full-table scans", type=int, default=64)
+    parser.add_argument("--scan-workers", help="Token ranges scanned concurrently", type=int, default=8)
+    parser.add_argument("--fetch-size", help="Rows per page of a token range scan", type=int, default=5000)
+    parser.add_argument(
+        "--totals",
+        help="Read CTR, spend and clicks from the daily totals of load_to_cassandra.py --incremental",
+        action="store_true",
+    )
     args = parser.parse_args()
 
-    if args.cutoff_date:
-        try:
+    try:
+        end_date = datetime.strptime(args.end_date, "%Y-%m-%d").date() if args.end_date else datetime.now().date()
+        if args.cutoff_date:
             cutoff_date = datetime.strptime(args.cutoff_date, "%Y-%m-%d").date()
-        except ValueError:
-            raise ValueError("Uknown format. Please, use YYYY-MM-DD.")
-    else:
-        cutoff_date = datetime.now().date() - timedelta(days=30)
+        else:
+            cutoff_date = end_date - timedelta(days=29)
+    except ValueError:
+        raise ValueError("Uknown format. Please, use YYYY-MM-DD.")
 
-    runner = CassandraQueryRunner()
-    runner.run_all(date=cutoff_date)
+    runner = CassandraQueryRunner(
+        scan_splits=args.scan_splits,
+        scan_workers=args.scan_workers,
+        fetch_size=args.fetch_size,
+        totals=args.totals,
+    )
+    runner.run_all(date=cutoff_date, end_date=end_date)
@@ -0,0 +1,132 @@
+# etl/dimension_cache.py
+# Локальний кеш довідників (назва -> ID) у SQLite, спільний для всіх завантажувачів.
+# Кеш перевіряється одним запитом CHECKSUM TABLE: таблиця перечитується з MySQL тільки
+# якщо вона змінилась з моменту збереження
+
+import json
+import os
+import sqlite3
+
+DEFAULT_PATH = os.environ.get("DIMENSION_CACHE_PATH", "/data/dimension_cache.sqlite")
+
+# таблиця -> (ID, назва, додаткові колонки)
+DIMENSIONS = {
+    "Advertisers": ("AdvertiserID", "AdvertiserName", []),
+    "Locations": ("LocationID", "LocationName", []),
+    "Interests": ("InterestID", "Name", []),
+    "Campaigns": ("CampaignID", "CampaignName", ["AdvertiserID", "TargetingLocationID"]),
+}
+
+
+class DimensionCache:
+    def __init__(self, path=DEFAULT_PATH):
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checksums (table_name TEXT PRIMARY KEY, checksum INTEGER)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS targeting (criteria TEXT PRIMARY KEY, parsed TEXT)")
+        for table, (id_column, name_column, extra_columns) in DIMENSIONS.items():
+            columns = ", ".join([f"{id_column} INTEGER PRIMARY KEY", f"{name_column} TEXT", *extra_columns])
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+        self.db.commit()
+        self._maps = {}
+
+    # ------------ Validation ----------------
+
+    def sync(self, conn):
+        """Перевірка кешу проти MySQL: одна команда CHECKSUM TABLE на всі довідники.
+        Змінені таблиці перечитуються повністю (довідники невеликі)"""
+        cursor = conn.cursor()
+        cursor.execute("CHECKSUM TABLE " + ", ".join(DIMENSIONS))
+        current = {name.split(".")[-1]: checksum for name, checksum in cursor.fetchall()}
+        cursor.close()
+
+        stored = dict(self.db.execute("SELECT table_name, checksum FROM checksums"))
+        for table in DIMENSIONS:
+            if stored.get(table) != current.get(table):
+                self.reload(conn, table, current.get(table))
+
+    def reload(self, conn, table, checksum=None):
+        id_column, name_column, extra_columns = DIMENSIONS[table]
+        columns = [id_column, name_column, *extra_columns]
+
+        cursor = conn.cursor()
+        if checksum is None:
+            cursor.execute(f"CHECKSUM TABLE {table}")
+            checksum = cursor.fetchone()[1]
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        rows = cursor.fetchall()
+        cursor.close()
+
+        self.db.execute(f"DELETE FROM {table}")
+        self.db.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        )
+        self.db.execute(
+            "INSERT OR REPLACE INTO checksums (table_name, checksum) VALUES (?, ?)", (table, checksum)
+        )
+        self.db.commit()
+        self._maps.pop(table, None)
+
+    # ------------ Lookups ----------------
+
+    def get_map(self, table):
+        """{назва: ID} з кешу (без запитів до MySQL)"""
+        if table not in self._maps:
+            id_column, name_column, _ = DIMENSIONS[table]
+            self._maps[table] = dict(self.db.execute(f"SELECT {name_column}, {id_column} FROM {table}"))
+        return self._maps[table]
+
+    def get_rows(self, table):
+        """{ID: {колонка: значення}} з кешу, включно з додатковими колонками"""
+        id_column, name_column, extra_columns = DIMENSIONS[table]
+        columns = [id_column, name_column, *extra_columns]
+        cursor = self.db.execute(f"SELECT {', '.join(columns)} FROM {table}")
+        return {row[0]: dict(zip(columns, row)) for row in cursor}
+
+    def ensure(self, conn, table, names):
+        """Додає в MySQL тільки ті назви, яких ще немає в кеші, і повертає {назва: ID}.
+        Якщо нових назв немає - жодного запиту до MySQL"""
+        known = self.get_map(table)
+        missing = [name for name in names if name not in known]
+        if missing:
+            _, name_column, _ = DIMENSIONS[table]
+            cursor = conn.cursor()
+            cursor.executemany(
+                f"INSERT IGNORE INTO {table} ({name_column}) VALUES (%s)",
+                [(name,) for name in missing],
+            )
+            cursor.close()
+            conn.commit()
+            self.reload(conn, table)
+        return self.get_map(table)
+
+    # ------------ Targeting criteria ----------------
+
+    def parse_targeting(self, values, parser):
+        """{TargetingCriteria: parser(TargetingCriteria)}; parser викликається тільки для рядків,
+        яких ще немає в кеші"""
+        values = list(dict.fromkeys(values))
+        parsed = {}
+        for i in range(0, len(values), 500):
+            batch = values[i:i + 500]
+            cursor = self.db.execute(
+                f"SELECT criteria, parsed FROM targeting WHERE criteria IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            parsed.update((criteria, tuple(json.loads(result))) for criteria, result in cursor)
+
+        missing = [criteria for criteria in values if criteria not in parsed]
+        if missing:
+            new = {criteria: tuple(parser(criteria)) for criteria in missing}
+            self.db.executemany(
+                "INSERT OR REPLACE INTO targeting (criteria, parsed) VALUES (?, ?)",
+                [(criteria, json.dumps(result)) for criteria, result in new.items()],
+            )
+            self.db.commit()
+            parsed.update(new)
+        return parsed
+
+    def close(self):
+        self.db.close()
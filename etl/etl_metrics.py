@@ -0,0 +1,191 @@
+# etl/etl_metrics.py
+# Метрики етапів ETL (час, рядки, запити до БД, пам'ять) і JSON-звіт про запуск.
+# Однаковий набір метрик для transform_load.py, load_to_mongo.py та load_to_cassandra.py
+
+import cProfile
+import json
+import os
+import resource
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_DIR = os.environ.get("ETL_REPORT_DIR", "/data/reports")
+# "cprofile" - окремий .prof файл для кожного етапу
+PROFILE = os.environ.get("ETL_PROFILE")
+
+PHASES = ("parse", "transform", "write")
+
+
+def peak_rss_mb():
+    """Пік RSS процесу з останнього reset_peak_rss() (ru_maxrss у Linux - кілобайти)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Скидає пік RSS процесу (VmHWM) до поточного RSS, щоб виміряти пік одного етапу.
+    False, якщо ядро цього не дозволяє (не Linux або /proc/self/clear_refs недоступний)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.rows_read = 0
+        self.rows_written = 0
+        self.round_trips = 0
+        self.phase_time = dict.fromkeys(PHASES, 0.0)
+        self.wall_time = 0.0
+        # None - пік етапу не виміряно, є тільки пік процесу в звіті
+        self.peak_rss_mb = None
+
+    @contextmanager
+    def phase(self, name):
+        """Час всередині блоку додається до parse / transform / write"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_time[name] += time.perf_counter() - start
+
+    def timed_iter(self, iterable, phase="parse"):
+        """Ітератор, час отримання кожного елемента якого рахується як phase (напр. читання CSV частинами)"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(phase):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def to_dict(self):
+        rows = self.rows_written or self.rows_read
+        return {
+            "stage": self.name,
+            "wall_time": round(self.wall_time, 4),
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "rows_per_sec": round(rows / self.wall_time, 1) if self.wall_time else None,
+            "round_trips": self.round_trips,
+            "peak_rss_mb": round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+            **{f"{phase}_time": round(value, 4) for phase, value in self.phase_time.items()},
+        }
+
+
+class RunReport:
+    def __init__(self, run_name, report_dir=REPORT_DIR, profile=PROFILE):
+        self.run_name = run_name
+        self.report_dir = report_dir
+        self.profile = profile
+        self.started_at = datetime.now()
+        self.stages = []
+        self.current = None
+        self._start = time.perf_counter()
+        # пік процесу до останнього скидання піку; етапи, що ще виконуються (вкладені)
+        self._peak_rss_mb = 0.0
+        self._active = []
+        self._peak_per_stage = reset_peak_rss()
+
+    def _fold_peak_rss(self):
+        """Переносить пік з останнього скидання в пік процесу і в етапи, що ще виконуються"""
+        peak = peak_rss_mb()
+        self._peak_rss_mb = max(self._peak_rss_mb, peak)
+        for metrics in self._active:
+            metrics.peak_rss_mb = max(metrics.peak_rss_mb or 0.0, peak)
+
+    @contextmanager
+    def stage(self, name):
+        metrics = StageMetrics(name)
+        self.stages.append(metrics)
+        previous, self.current = self.current, metrics
+        profiler = cProfile.Profile() if self.profile == "cprofile" else None
+        if profiler:
+            profiler.enable()
+        if self._peak_per_stage:
+            # пік процесу не зменшується, тому без скидання кожен етап отримав би пік усіх попередніх
+            self._fold_peak_rss()
+            reset_peak_rss()
+            self._active.append(metrics)
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            metrics.wall_time = time.perf_counter() - start
+            if self._peak_per_stage:
+                self._fold_peak_rss()
+                self._active.remove(metrics)
+            if profiler:
+                profiler.disable()
+                os.makedirs(self.report_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.report_dir, f"{self._file_prefix()}_{name}.prof"))
+            self.current = previous
+            print(
+                f"[{self.run_name}] {name}: {metrics.wall_time:.2f}s, "
+                f"{metrics.rows_read} read, {metrics.rows_written} written, {metrics.round_trips} round trips"
+            )
+
+    def add(self, rows_read=0, rows_written=0, round_trips=0):
+        if self.current is None:
+            return
+        self.current.rows_read += rows_read
+        self.current.rows_written += rows_written
+        self.current.round_trips += round_trips
+
+    def track(self, target, methods, children=None):
+        """Проксі, що рахує виклики methods як запити до БД поточного етапу"""
+        return Tracked(target, self, methods, children)
+
+    def track_mysql(self, conn):
+        return self.track(conn, {"commit", "rollback"}, {"cursor": {"execute", "executemany"}})
+
+    def _file_prefix(self):
+        return f"{self.run_name}_{self.started_at:%Y%m%d_%H%M%S}"
+
+    def to_dict(self):
+        return {
+            "run": self.run_name,
+            "started_at": self.started_at.isoformat(),
+            "wall_time": round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": round(max(self._peak_rss_mb, peak_rss_mb()), 1),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def save(self):
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, f"{self._file_prefix()}.json")
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"Run report saved to {path}")
+        return path
+
+
+class Tracked:
+    def __init__(self, target, report, methods, children=None):
+        self._target = target
+        self._report = report
+        self._methods = methods
+        self._children = children or {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._methods and name not in self._children:
+            return attr
+
+        def wrapper(*args, **kwargs):
+            if name in self._methods:
+                self._report.add(round_trips=1)
+            result = attr(*args, **kwargs)
+            if name in self._children:
+                return Tracked(result, self._report, self._children[name])
+            return result
+
+        return wrapper
+
+    def __iter__(self):
+        return iter(self._target)
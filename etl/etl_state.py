@@ -0,0 +1,80 @@
+# etl/etl_state.py
+# Маніфест оброблених файлів для інкрементального ETL.
+# Зберігається в MySQL, тому оновлюється в тій самій транзакції, що й дані
+
+import os
+
+MANIFEST_DDL = """
+    CREATE TABLE IF NOT EXISTS EtlManifest (
+        SourceName VARCHAR(255) PRIMARY KEY,
+        Fingerprint VARCHAR(64) NOT NULL,
+        RowsLoaded BIGINT NOT NULL DEFAULT 0,
+        Completed TINYINT(1) NOT NULL DEFAULT 0,
+        Watermark DATETIME NULL,
+        LoadSeq BIGINT NULL,
+        UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+"""
+
+
+def ensure_manifest(cursor):
+    cursor.execute(MANIFEST_DDL)
+    # маніфести, створені до появи LoadSeq
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'EtlManifest' AND COLUMN_NAME = 'LoadSeq'
+        """
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute("ALTER TABLE EtlManifest ADD COLUMN LoadSeq BIGINT NULL")
+
+
+def file_fingerprint(path):
+    """Розмір + час зміни файлу; якщо файл не змінився - його не треба читати ще раз"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def get_entry(cursor, source):
+    cursor.execute(
+        """
+        SELECT Fingerprint, RowsLoaded, Completed, Watermark
+        FROM EtlManifest WHERE SourceName = %s
+        """,
+        (source,),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    fingerprint, rows_loaded, completed, watermark = row
+    return {
+        "fingerprint": fingerprint,
+        "rows_loaded": rows_loaded,
+        "completed": bool(completed),
+        "watermark": watermark,
+    }
+
+
+def is_unchanged(entry, fingerprint):
+    return entry is not None and entry["completed"] and entry["fingerprint"] == fingerprint
+
+
+def save_entry(cursor, source, fingerprint, rows_loaded, completed, watermark=None):
+    """Коміт робить викликаючий код разом з даними.
+    LoadSeq - найбільший LoadSeq в AdEvents на момент запису: рядки цієї транзакції або вже закомічені
+    (паралельні воркери зберігають позицію файлу тільки після коміту всіх частин), тому після коміту
+    всі рядки AdEvents з меншим LoadSeq закомічені - до нього читає load_to_cassandra.py --incremental"""
+    cursor.execute(
+        """
+        INSERT INTO EtlManifest (SourceName, Fingerprint, RowsLoaded, Completed, Watermark, LoadSeq)
+        VALUES (%s, %s, %s, %s, %s, (SELECT MAX(LoadSeq) FROM AdEvents)) AS new
+        ON DUPLICATE KEY UPDATE
+            Fingerprint = new.Fingerprint,
+            RowsLoaded = new.RowsLoaded,
+            Completed = new.Completed,
+            Watermark = GREATEST(COALESCE(EtlManifest.Watermark, new.Watermark), COALESCE(new.Watermark, EtlManifest.Watermark)),
+            LoadSeq = new.LoadSeq
+        """,
+        (source, fingerprint, rows_loaded, int(completed), watermark),
+    )
@@ -1,88 +1,557 @@
+import argparse
+import itertools
 import os
-from pymongo import MongoClient
-import pandas as pd
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-df_users = pd.read_csv("/data/users.csv")
-df_campaigns = pd.read_csv("/data/campaigns.csv")
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from pymongo.write_concern import WriteConcern
 
-df_events = pd.read_csv("/data/ad_events_short.csv", skiprows=[0], header=None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-df_events.columns = [
+from dimension_cache import DimensionCache
+from etl_metrics import RunReport
+from etl_state import file_fingerprint
+import staging
+
+# колонки подій, з яких будуються документи; решта колонок з Parquet не читається
+EVENT_COLUMNS = [
     "EventID",
     "AdvertiserName",
     "CampaignName",
-    "CampaignStartDate",
-    "CampaignEndDate",
-    "TargetingAge",
-    "TargetingInterest",
-    "TargetingCountry",
-    "AdSlotSize",
     "UserID",
     "Device",
     "Location",
     "Timestamp",
-    "BidAmount",
     "AdCost",
     "WasClicked",
     "ClickTimestamp",
     "AdRevenue",
-    "Budget",
-    "RemainingBudget",
 ]
-df_events["Timestamp"] = pd.to_datetime(df_events["Timestamp"])
-df_events["ClickTimestamp"] = pd.to_datetime(df_events["ClickTimestamp"], errors='coerce')
 
-MONGO_HOST = os.environ.get("MONGO_HOST", "localhost")
-client = MongoClient(f"mongodb://{MONGO_HOST}:27017/")
-db = client["ad_analytics"]
-users_col = db["users"]
-users_col.drop()
-
-for user_id, user_group in df_events.groupby("UserID"):
-    user_profile = df_users[df_users["UserID"] == user_id]
-    if user_profile.empty:
-        continue
-
-    profile = user_profile.iloc[0].to_dict()
-    interests = profile["Interests"].split(",") if isinstance(profile["Interests"], str) else []
-
-    # Group by session (using device and date)
-    user_group["SessionKey"] = user_group["Device"] + "_" + user_group["Timestamp"].dt.date.astype(str)
-    sessions = []
-    for skey, session_group in user_group.groupby("SessionKey"):
-        impressions = []
-        for _, row in session_group.iterrows():
-            impression = {
-                "event_id": row["EventID"],
-                "timestamp": row["Timestamp"],
-                "campaign_name": row["CampaignName"],
-                "device": row["Device"],
-                "location": row["Location"],
-                "advertiser_name": row["AdvertiserName"],
-                "was_clicked": bool(row["WasClicked"]),
-                "click_timestamp": row["ClickTimestamp"] if pd.notnull(row["ClickTimestamp"]) else None,
-                "ad_cost": row["AdCost"],
-                "ad_revenue": row["AdRevenue"]
+# поле impression -> колонка подій
+IMPRESSION_FIELDS = {
+    "event_id": "EventID",
+    "timestamp": "Timestamp",
+    "campaign_name": "CampaignName",
+    "campaign_id": "CampaignID",
+    "device": "Device",
+    "location": "Location",
+    "advertiser_name": "AdvertiserName",
+    "advertiser_id": "AdvertiserID",
+    "was_clicked": "WasClicked",
+    "click_timestamp": "ClickTimestamp",
+    "ad_cost": "AdCost",
+    "ad_revenue": "AdRevenue",
+}
+
+
+def python_values(frame):
+    """Колонки DataFrame -> python типи для BSON (NaN/NaT -> None, numpy int/bool -> int/bool)"""
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), None)
+
+
+def session_events(df_events, profiles, campaign_map, advertiser_map):
+    """Події користувачів, для яких є профіль, з SessionKey (пристрій + дата) та ID кампанії і
+    рекламодавця, відсортовані за (UserID, SessionKey). stable: всередині сесії - порядок файлу"""
+    events = df_events[df_events["UserID"].isin(profiles.index)]
+    events = events.assign(
+        SessionKey=events["Device"] + "_" + events["Timestamp"].dt.strftime("%Y-%m-%d"),
+        CampaignID=events["CampaignName"].map(campaign_map).astype("Int64"),
+        AdvertiserID=events["AdvertiserName"].map(advertiser_map).astype("Int64"),
+    )
+    return events[events["SessionKey"].notna()].sort_values(["UserID", "SessionKey"], kind="stable")
+
+
+def session_summaries(events):
+    """Один рядок на сесію з session_events: пристрій, час початку, кількість показів і кликів"""
+    return (
+        events.groupby(["UserID", "SessionKey"], sort=True)
+        .agg(
+            Device=("Device", "first"),
+            StartTime=("Timestamp", "min"),
+            Impressions=("EventID", "size"),
+            Clicks=("WasClicked", "sum"),
+        )
+        .reset_index()
+    )
+
+
+def build_user_documents(sessions, profiles):
+    """Документи users: профіль + підсумки по всіх сесіях. Самі сесії лежать в user_sessions,
+    тому розмір документа не залежить від активності користувача"""
+    totals = sessions.groupby("UserID", sort=True).agg(
+        session_count=("SessionKey", "size"),
+        impressions=("Impressions", "sum"),
+        clicks=("Clicks", "sum"),
+        first_seen=("StartTime", "min"),
+        last_seen=("StartTime", "max"),
+    )
+    users = python_values(profiles.loc[totals.index].join(totals).reset_index())
+    for profile in users.to_dict("records"):
+        interests = profile["Interests"].split(",") if isinstance(profile["Interests"], str) else []
+        yield {
+            "user_id": profile["UserID"],
+            "age": profile["Age"],
+            "gender": profile["Gender"],
+            "location": profile["Location"],
+            "interests": interests,
+            "signup_date": profile["SignupDate"],
+            "session_count": profile["session_count"],
+            "impressions": profile["impressions"],
+            "clicks": profile["clicks"],
+            "first_seen": profile["first_seen"],
+            "last_seen": profile["last_seen"],
+        }
+
+
+def build_session_buckets(sessions, bucket_size):
+    """Документи user_sessions: сесії користувача за місяць, не більше bucket_size сесій на документ.
+    Сесія - тільки підсумок (impressions, clicks, start_time): події сесії лежать в impressions
+    (user_id, session_id), тому розмір документа обмежений bucket_size, а не кількістю подій.
+    Один прохід по сесіях, відсортованих за (UserID, місяць, час початку)"""
+    if sessions.empty:
+        return
+
+    sessions = sessions.assign(Month=sessions["StartTime"].dt.strftime("%Y-%m"))
+    sessions = sessions.sort_values(["UserID", "Month", "StartTime"], kind="stable")
+    sessions["Bucket"] = sessions.groupby(["UserID", "Month"]).cumcount() // bucket_size
+
+    keys = sessions[["UserID", "Month", "Bucket"]]
+    # перша сесія кожного документа
+    new_bucket = keys.ne(keys.shift()).any(axis=1).to_numpy()
+    columns = ["UserID", "Month", "Bucket", "SessionKey", "Device", "StartTime", "Impressions", "Clicks"]
+
+    bucket = None
+    for is_new, values in zip(new_bucket, python_values(sessions[columns]).itertuples(index=False, name=None)):
+        user_id, month, bucket_no, session_key, device, start_time, session_impressions, clicks = values
+        if is_new:
+            if bucket is not None:
+                yield bucket
+            bucket = {
+                "_id": f"{user_id}:{month}:{bucket_no}",
+                "user_id": user_id,
+                "month": month,
+                "bucket": bucket_no,
+                "start_time": start_time,
+                "end_time": start_time,
+                "session_count": 0,
+                "impressions": 0,
+                "clicks": 0,
+                "sessions": [],
             }
-            impressions.append(impression)
-        
-        sessions.append({
-            "session_id": skey,
-            "start_time": session_group["Timestamp"].min(),
-            "device": session_group["Device"].iloc[0],
-            "impressions": impressions
+        bucket["sessions"].append({
+            "session_id": session_key,
+            "start_time": start_time,
+            "device": device,
+            "impressions": session_impressions,
+            "clicks": clicks,
         })
+        bucket["end_time"] = start_time
+        bucket["session_count"] += 1
+        bucket["impressions"] += session_impressions
+        bucket["clicks"] += clicks
+    yield bucket
+
+
+def build_impression_documents(events):
+    """Плоскі документи колекції impressions (один на подію, _id = EventID) з session_events"""
+    impression_fields = {field: column for field, column in IMPRESSION_FIELDS.items() if field != "event_id"}
+    fields = ["_id", "user_id", "session_id", *impression_fields]
+    columns = ["EventID", "UserID", "SessionKey", *impression_fields.values()]
+    for values in python_values(events[columns]).itertuples(index=False, name=None):
+        yield dict(zip(fields, values))
+
+
+def build_stats_updates(events, seq):
+    """$inc-оновлення user_campaign_stats: одне на пару (користувач, кампанія) з подій одного файлу staging.
+    seq - номер файлу в журналі STATS_LEDGER; документ запам'ятовує номер останнього врахованого файлу
+    (applied_seq), а фільтр пропускає документи, де цей файл уже врахований, тому повтор оновлень файлу
+    лічильники не змінює"""
+    stats = events.groupby(["UserID", "CampaignName"], sort=False).agg(
+        campaign_id=("CampaignID", "first"),
+        impressions=("EventID", "size"),
+        clicks=("WasClicked", "sum"),
+        last_seen=("Timestamp", "max"),
+    )
+    for user_id, campaign_name, campaign_id, impressions, clicks, last_seen in python_values(
+        stats.reset_index()
+    ).itertuples(index=False, name=None):
+        yield UpdateOne(
+            {"user_id": user_id, "campaign_name": campaign_name, "applied_seq": {"$not": {"$gte": seq}}},
+            {
+                "$inc": {"impressions": impressions, "clicks": clicks},
+                "$max": {"last_seen": last_seen},
+                "$set": {"campaign_id": campaign_id, "applied_seq": seq},
+            },
+            upsert=True,
+        )
+
+
+# ------------- Writing ----------------
+
+MONGO_HOST = os.environ.get("MONGO_HOST", "localhost")
+MONGO_URI = f"mongodb://{MONGO_HOST}:27017/"
+DUPLICATE_KEY = 11000
+
+
+def make_write_concern(w="1", journal=True):
+    """w: кількість вузлів, "majority" або "0" (без підтвердження - найшвидше для backfill)"""
+    if w == "0":
+        return WriteConcern(w=0)
+    return WriteConcern(w=int(w) if w.isdigit() else w, j=journal)
+
+
+# колекція -> індекси, які будуються після завантаження
+IMPRESSION_INDEXES = [
+    # клики рекламодавця за період (дашборд по годинах)
+    [("advertiser_name", ASCENDING), ("was_clicked", ASCENDING), ("timestamp", ASCENDING)],
+    # взаємодії користувача / користувач x кампанія (ad fatigue, топ категорій)
+    [("user_id", ASCENDING), ("campaign_name", ASCENDING), ("was_clicked", ASCENDING)],
+]
+SESSION_INDEXES = [
+    # останні сесії користувача: бакети в порядку часу, читаються тільки перші кілька
+    IndexModel([("user_id", ASCENDING), ("end_time", DESCENDING)]),
+]
+STATS_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("campaign_name", ASCENDING)], unique=True),
+    # ad fatigue: рівність по clicks + діапазон по impressions, читаються тільки документи результату
+    IndexModel([("clicks", ASCENDING), ("impressions", ASCENDING)]),
+]
+# журнал файлів staging для user_campaign_stats: _id - файл, fingerprint, seq - порядковий номер, completed
+STATS_LEDGER = "user_campaign_stats_files"
+
+
+def get_database(client, write_concern):
+    return client.get_database("ad_analytics", write_concern=write_concern)
+
+
+def insert_batch(collection, documents):
+    """Невпорядкований insert_many: сервер пише весь пакет, не зупиняючись на першій помилці.
+    Ключ документа унікальний (user_id в users, _id = EventID в impressions), тому повтор пакета
+    після збою не створює дублікатів - помилки дубліката ключа ігноруються"""
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as err:
+        errors = [error for error in err.details["writeErrors"] if error["code"] != DUPLICATE_KEY]
+        if errors or err.details.get("writeConcernErrors"):
+            raise
+
+
+def update_batch(collection, updates):
+    """Невпорядкований bulk_write оновлень build_stats_updates. Якщо файл уже враховано в документі
+    (applied_seq не менший за його seq), фільтр не знаходить документ і upsert впирається в унікальний
+    індекс (user_id, campaign_name) - такі помилки дубліката ключа означають "вже пораховано" і ігноруються"""
+    try:
+        collection.bulk_write(updates, ordered=False)
+    except BulkWriteError as err:
+        errors = [error for error in err.details["writeErrors"] if error["code"] != DUPLICATE_KEY]
+        if errors or err.details.get("writeConcernErrors"):
+            raise
+
+
+def iter_batches(documents, batch_size):
+    iterator = iter(documents)
+    while batch := list(itertools.islice(iterator, batch_size)):
+        yield batch
 
-    user_doc = {
-        "user_id": user_id,
-        "age": profile["Age"],
-        "gender": profile["Gender"],
-        "location": profile["Location"],
-        "interests": interests,
-        "signup_date": profile["SignupDate"],
-        "sessions": sessions
+
+# ------------- Parallel write ----------------
+# Кожен процес-воркер має свій MongoClient; головний процес будує документи і роздає пакети
+
+_worker_db = None
+
+
+def _init_worker(w, journal):
+    global _worker_db
+    _worker_db = get_database(MongoClient(MONGO_URI), make_write_concern(w, journal))
+
+
+def write_batch(collection_name, batch_id, documents, retries):
+    start = time.perf_counter()
+    for attempt in range(1, retries + 2):
+        try:
+            insert_batch(_worker_db[collection_name], documents)
+            return os.getpid(), len(documents), time.perf_counter() - start
+        except PyMongoError as err:
+            if attempt > retries:
+                raise
+            print(f"Batch {batch_id} failed (attempt {attempt}): {err}. Retrying...")
+            time.sleep(attempt)
+
+
+def write_documents_parallel(collection_name, batches, workers, w, journal, retries=3):
+    """Одночасно в черзі не більше workers * 2 пакетів, тому пам'ять обмежена.
+    Повертає (записано документів, кількість пакетів, невдалі пакети)"""
+    worker_stats = defaultdict(lambda: [0, 0.0])
+    failed_batches = []
+    written = 0
+    pending = {}
+
+    def collect(done):
+        nonlocal written
+        for future in done:
+            batch_id, batch_rows = pending.pop(future)
+            try:
+                pid, rows, duration = future.result()
+            except Exception as err:
+                print(f"Batch {batch_id} ({batch_rows} documents) failed: {err}")
+                failed_batches.append(batch_id)
+                continue
+            worker_stats[pid][0] += rows
+            worker_stats[pid][1] += duration
+            written += rows
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(w, journal)) as pool:
+        batch_id = 0
+        for batch in batches:
+            future = pool.submit(write_batch, collection_name, batch_id, batch, retries)
+            pending[future] = (batch_id, len(batch))
+            batch_id += 1
+
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        collect(wait(pending).done)
+
+    for pid, (rows, duration) in sorted(worker_stats.items()):
+        rate = rows / duration if duration else 0.0
+        print(f"Worker {pid}: {rows} documents in {duration:.2f}s ({rate:,.0f} docs/sec)")
+    if failed_batches:
+        print(f"Failed batches (not loaded): {sorted(failed_batches)}")
+
+    return written, batch_id, failed_batches
+
+
+# ------------- Loading ----------------
+
+def update_user_campaign_stats(report, stats_col, ledger_col, profiles, campaign_map, batch_size, rebuild=False):
+    """Лічильники показів і кликів на (користувач, кампанія) не перебудовуються, а оновлюються
+    через $inc тільки з файлів staging, які ще не враховані. Новий файл отримує в журналі наступний seq,
+    і файли обробляються строго по порядку seq: наступний не починається, поки попередній не завершено.
+    Тому файл, перерваний посередині, при наступному запуску дораховується тільки в документах з меншим
+    applied_seq, без подвійного рахунку, і лише потім позначається завершеним"""
+    stage = report.current
+    if rebuild:
+        stats_col.drop()
+        ledger_col.drop()
+    stats_col.create_indexes(STATS_INDEXES)
+
+    entries = {entry["_id"]: entry for entry in ledger_col.find()}
+    fingerprints = {
+        name: file_fingerprint(os.path.join(staging.STAGING_DIR, name)) for name in staging.list_event_files()
     }
+    changed = [name for name in fingerprints if name in entries and entries[name]["fingerprint"] != fingerprints[name]]
+    if changed:
+        print(
+            f"{len(changed)} staged files changed after they were counted in user_campaign_stats; "
+            "run with --rebuild-stats to recount them"
+        )
+
+    next_seq = max((entry["seq"] for entry in entries.values()), default=0) + 1
+    new_files = [name for name in fingerprints if name not in entries]
+    new_entries = [
+        {"_id": name, "fingerprint": fingerprints[name], "seq": seq, "completed": False}
+        for seq, name in enumerate(new_files, start=next_seq)
+    ]
+    if new_entries:
+        ledger_col.insert_many(new_entries)
+    # незавершений файл попереднього запуску має менший seq, тому дораховується першим
+    pending = [entry for entry in entries.values() if not entry["completed"]] + new_entries
+    pending.sort(key=lambda entry: entry["seq"])
+    print(f"Counting {len(pending)} staged files in user_campaign_stats")
+
+    for entry in pending:
+        name = entry["_id"]
+        if name not in fingerprints:
+            raise RuntimeError(
+                f"Staged file {name} is not fully counted in user_campaign_stats and no longer exists; "
+                "run with --rebuild-stats"
+            )
+        with stage.phase("parse"):
+            events = staging.read_event_files([name], ["EventID", "UserID", "CampaignName", "Timestamp", "WasClicked"])
+        stage.rows_read += len(events)
+        with stage.phase("transform"):
+            events = events[events["UserID"].isin(profiles.index)]
+            events = events.assign(CampaignID=events["CampaignName"].map(campaign_map).astype("Int64"))
+
+        updates = stage.timed_iter(build_stats_updates(events, entry["seq"]), "transform")
+        for batch in iter_batches(updates, batch_size):
+            with stage.phase("write"):
+                update_batch(stats_col, batch)
+            stage.rows_written += len(batch)
+
+        ledger_col.update_one({"_id": name}, {"$set": {"completed": True}})
+
+
+def write_collection(report, collection, documents, batch_size, workers, w, journal):
+    """Пакетний запис documents в collection в межах поточного етапу звіту.
+    RuntimeError, якщо якийсь пакет не записався після всіх повторів"""
+    stage = report.current
+    start = time.perf_counter()
+    batches = iter_batches(stage.timed_iter(documents, "transform"), batch_size)
+    if workers > 1:
+        # запити воркерів (власні з'єднання) рахуються по одному на пакет
+        written, batch_count, failed = write_documents_parallel(
+            collection.name, batches, workers, w, journal
+        )
+        # у звіт потрапляють тільки записані пакети; невдалі зупиняють завантаження
+        report.add(rows_written=written, round_trips=batch_count - len(failed))
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} {collection.name} batches failed and were not loaded: {sorted(failed)} "
+                f"({written} documents were written)"
+            )
+    else:
+        written = 0
+        for batch in batches:
+            with stage.phase("write"):
+                insert_batch(collection, batch)
+            written += len(batch)
+        report.add(rows_written=written)
+
+    duration = time.perf_counter() - start
+    rate = written / duration if duration else 0.0
+    print(f"Written {written} {collection.name} documents in {duration:.2f}s ({rate:,.0f} docs/sec)")
+
+
+def run(batch_size=1000, workers=1, w="1", journal=True, bucket_size=50, rebuild_stats=False, report=None):
+    report = report or RunReport("load_to_mongo")
+
+    # CSV конвертуються в Parquet тільки якщо змінились з минулого запуску (інакше це вже зробив
+    # transform_load.py), далі читаються типізовані дані без повторного парсингу
+    with report.stage("staging") as stage:
+        with stage.phase("parse"):
+            stage.rows_written = sum(staging.stage_all(staging.EVENTS_CSV).values())
+
+    with report.stage("read_staging") as stage:
+        with stage.phase("parse"):
+            df_users = next(staging.iter_users())
+            df_events = staging.read_events(EVENT_COLUMNS)
+            # BSON не підтримує Decimal і date - зберігаємо ті самі типи, що й раніше
+            df_events["AdCost"] = df_events["AdCost"].astype(float)
+            df_events["AdRevenue"] = df_events["AdRevenue"].astype(float)
+            df_users["SignupDate"] = df_users["SignupDate"].astype(str)
+        stage.rows_read = len(df_users) + len(df_events)
+
+    # ID кампаній і рекламодавців беруться з локального кешу довідників (його заповнює transform_load.py),
+    # без запитів до MySQL
+    dimension_cache = DimensionCache()
+    campaign_map = dimension_cache.get_map("Campaigns")
+    advertiser_map = dimension_cache.get_map("Advertisers")
+
+    client = MongoClient(MONGO_URI)
+    write_concern = make_write_concern(w, journal)
+    db = get_database(client, write_concern)
+    tracked_methods = {"drop", "create_index", "create_indexes", "insert_many", "bulk_write", "find", "update_one"}
+    users_col = report.track(db["users"], tracked_methods)
+    impressions_col = report.track(db["impressions"], tracked_methods)
+    stats_col = report.track(db["user_campaign_stats"], tracked_methods)
+    ledger_col = report.track(db[STATS_LEDGER], tracked_methods)
+    sessions_col = report.track(db["user_sessions"], tracked_methods)
+    print(f"Writing in unordered batches of {batch_size} documents, write concern {write_concern.document}")
+
+    try:
+        profiles = df_users.drop_duplicates("UserID").set_index("UserID")
+
+        with report.stage("users") as stage:
+            with stage.phase("transform"):
+                events = session_events(df_events, profiles, campaign_map, advertiser_map)
+                sessions = session_summaries(events)
+            stage.rows_read = len(events)
+            users_col.drop()
+            users_col.create_index([("user_id", ASCENDING)], unique=True)
+            write_collection(
+                report, users_col, build_user_documents(sessions, profiles), batch_size, workers, w, journal
+            )
+
+        # Сесії - окремими документами-бакетами (користувач, місяць, не більше bucket_size сесій):
+        # документ не росте до ліміту 16 MB, а "останні N сесій" - це читання кількох документів по індексу
+        with report.stage("user_sessions") as stage:
+            stage.rows_read = len(sessions)
+            sessions_col.drop()
+            write_collection(
+                report,
+                sessions_col,
+                build_session_buckets(sessions, bucket_size),
+                batch_size,
+                workers,
+                w,
+                journal,
+            )
+            with stage.phase("write"):
+                sessions_col.create_indexes(SESSION_INDEXES)
+
+        # Плоска колекція для аналітики: одна подія - один документ, запити run_queries.py
+        # фільтрують по індексу замість $unwind всіх сесій. Вторинні індекси будуються один раз після запису
+        with report.stage("impressions") as stage:
+            stage.rows_read = len(events)
+            impressions_col.drop()
+            write_collection(
+                report, impressions_col, build_impression_documents(events), batch_size, workers, w, journal
+            )
+            with stage.phase("write"):
+                impressions_col.create_indexes([IndexModel(keys) for keys in IMPRESSION_INDEXES])
+
+        with report.stage("user_campaign_stats"):
+            update_user_campaign_stats(
+                report, stats_col, ledger_col, profiles, campaign_map, batch_size, rebuild_stats
+            )
+    finally:
+        dimension_cache.close()
+        client.close()
+        report.save()
+    print("MongoDB populated with structured user engagement data.")
+
 
-    users_col.replace_one({"user_id": user_id}, user_doc, upsert=True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--batch-size",
+        help="Documents per unordered insert_many call",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of writer processes, each with its own MongoClient",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--write-concern",
+        help="Write concern w: number of nodes, 'majority' or 0 (unacknowledged, for backfills)",
+        type=str,
+        default="1",
+    )
+    parser.add_argument(
+        "--no-journal",
+        help="Acknowledge writes before they reach the journal (faster backfills)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--bucket-size",
+        help="Maximum number of sessions in one user_sessions document (user/month bucket)",
+        type=int,
+        default=50,
+    )
+    parser.add_argument(
+        "--rebuild-stats",
+        help="Drop user_campaign_stats and recount it from all staged events",
+        action="store_true",
+    )
+    args = parser.parse_args()
 
-print("MongoDB populated with structured user engagement data.")
+    run(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        w=args.write_concern,
+        journal=not args.no_journal,
+        bucket_size=args.bucket_size,
+        rebuild_stats=args.rebuild_stats,
+    )
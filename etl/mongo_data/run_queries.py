@@ -1,35 +1,65 @@
-from pymongo import MongoClient
+import argparse
 import json
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 
+from pymongo import MongoClient
+
 MONGO_HOST = os.environ.get("MONGO_HOST", "localhost")
-client = MongoClient(f"mongodb://{MONGO_HOST}:27017/")
-db = client["ad_analytics"]
-collection = db["users"]
+MONGO_URI = f"mongodb://{MONGO_HOST}:27017/"
+
+IMPRESSION_FIELDS = [
+    "timestamp",
+    "campaign_name",
+    "campaign_id",
+    "device",
+    "location",
+    "advertiser_name",
+    "advertiser_id",
+    "was_clicked",
+    "click_timestamp",
+    "ad_cost",
+    "ad_revenue",
+]
 
-results_dir = "/app/results"
-os.makedirs(results_dir, exist_ok=True)
+# "зараз" для запиту за останню добу: дані згенеровані за минулий період
+REFERENCE_TIME = datetime.fromisoformat("2024-11-13T03:01:37")
+
+
+# ------------- Pipelines ----------------
+# Колекції заповнює load_to_mongo.py: impressions - одна подія на документ, user_sessions - сесії
+# бакетами (користувач, місяць), user_campaign_stats - лічильники показів/кликів на (користувач, кампанія)
 
 # 1. All ad interactions for a specific user (impressions + clicks)
-def query_all_interactions(user_id):
-    pipeline = [
+# Індекс (user_id, campaign_name, was_clicked): читаються тільки події цього користувача
+def pipeline_all_interactions(user_id):
+    return [
         {"$match": {"user_id": user_id}},
-        {"$unwind": "$sessions"},
-        {"$unwind": "$sessions.impressions"},
         {"$project": {
             "_id": 0,
             "user_id": 1,
-            "session_id": "$sessions.session_id",
-            "impression": "$sessions.impressions"
+            "session_id": 1,
+            "impression": {"event_id": "$_id", **{field: f"${field}" for field in IMPRESSION_FIELDS}}
         }}
     ]
-    return list(collection.aggregate(pipeline))
 
 # 2. Last 5 ad sessions with timestamps and click behavior
-def query_last_5_sessions(user_id):
-    pipeline = [
+# Бакети user_sessions за індексом (user_id, end_time): останні 5 сесій лежать не більше ніж у 5 останніх
+# бакетах, кліки в сесії вже пораховані при завантаженні
+def pipeline_last_5_sessions(user_id):
+    return [
         {"$match": {"user_id": user_id}},
+        {"$sort": {"end_time": -1}},
+        {"$limit": 5},
+        {"$project": {
+            "user_id": 1,
+            "sessions.session_id": 1,
+            "sessions.start_time": 1,
+            "sessions.clicks": 1
+        }},
         {"$unwind": "$sessions"},
         {"$sort": {"sessions.start_time": -1}},
         {"$limit": 5},
@@ -38,92 +68,261 @@ def query_last_5_sessions(user_id):
             "user_id": 1,
             "session_id": "$sessions.session_id",
             "start_time": "$sessions.start_time",
-            "clicks": {
-                "$size": {
-                    "$filter": {
-                        "input": "$sessions.impressions",
-                        "as": "imp",
-                        "cond": {"$eq": ["$$imp.was_clicked", True]}
-                    }
-                }
-            }
+            "clicks": "$sessions.clicks"
         }}
     ]
-    return list(collection.aggregate(pipeline))
 
 # 3. Number of ad clicks per hour per campaign in last 24h for specific advertiser
-def query_clicks_last_24h(advertiser_name):
-    since = datetime.fromisoformat("2024-11-13T03:01:37") - timedelta(hours=24)
-    pipeline = [
-        {"$unwind": "$sessions"},
-        {"$unwind": "$sessions.impressions"},
+# Індекс (advertiser_name, was_clicked, timestamp): дві рівності + діапазон часу - читаються тільки
+# клики цього рекламодавця за добу
+def pipeline_clicks_last_24h(advertiser_name, now=REFERENCE_TIME):
+    since = now - timedelta(hours=24)
+    return [
         {"$match": {
-            "sessions.impressions.was_clicked": True,
-            "sessions.impressions.timestamp": {"$gte": since},
-            "sessions.impressions.advertiser_name": advertiser_name
+            "advertiser_name": advertiser_name,
+            "was_clicked": True,
+            "timestamp": {"$gte": since}
         }},
         {"$group": {
             "_id": {
-                "campaign": "$sessions.impressions.campaign_name",
-                "hour": {"$hour": "$sessions.impressions.timestamp"}
+                "campaign": "$campaign_name",
+                "hour": {"$hour": "$timestamp"}
             },
             "clicks": {"$sum": 1}
         }}
     ]
-    return list(collection.aggregate(pipeline))
 
 # 4. Users who saw same ad 5+ times and never clicked
-def query_ad_fatigue():
-    pipeline = [
-        {"$unwind": "$sessions"},
-        {"$unwind": "$sessions.impressions"},
-        {"$group": {
+# Лічильники з user_campaign_stats (load_to_mongo.py оновлює їх через $inc): фільтр по індексу
+# (clicks, impressions), вартість залежить від розміру результату, а не від кількості показів
+def pipeline_ad_fatigue():
+    return [
+        {"$match": {
+            "clicks": 0,
+            "impressions": {"$gte": 5}
+        }},
+        {"$project": {
             "_id": {
                 "user_id": "$user_id",
-                "campaign": "$sessions.impressions.campaign_name"
+                "campaign": "$campaign_name"
             },
-            "total_impressions": {"$sum": 1},
-            "total_clicks": {
-                "$sum": {
-                    "$cond": ["$sessions.impressions.was_clicked", 1, 0]
-                }
-            }
-        }},
-        {"$match": {
-            "total_impressions": {"$gte": 5},
-            "total_clicks": 0
+            "total_impressions": "$impressions",
+            "total_clicks": "$clicks"
         }}
     ]
-    return list(collection.aggregate(pipeline))
 
 # 5. User's top 3 most engaged ad categories (clicked)
-def query_top_categories(user_id):
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$unwind": "$sessions"},
-        {"$unwind": "$sessions.impressions"},
-        {"$match": {"sessions.impressions.was_clicked": True}},
+def pipeline_top_categories(user_id):
+    return [
+        {"$match": {"user_id": user_id, "was_clicked": True}},
         {"$group": {
-            "_id": "$sessions.impressions.campaign_name",
+            "_id": "$campaign_name",
             "clicks": {"$sum": 1}
         }},
         {"$sort": {"clicks": -1}},
         {"$limit": 3}
     ]
-    return list(collection.aggregate(pipeline))
-
-# Run and save all queries
-queries = {
-    "1_all_interactions": query_all_interactions(475),
-    "2_last_5_sessions": query_last_5_sessions(933),
-    "3_clicks_last_24h": query_clicks_last_24h("Advertiser_47"),
-    "4_ad_fatigue_users": query_ad_fatigue(),
-    "5_top_categories": query_top_categories(436039)
+
+
+# назва запиту (і файлу результату) -> (колекція, параметр запиту, pipeline)
+QUERIES = {
+    "1_all_interactions": ("impressions", "user_id", pipeline_all_interactions),
+    "2_last_5_sessions": ("user_sessions", "user_id", pipeline_last_5_sessions),
+    "3_clicks_last_24h": ("impressions", "advertiser_name", pipeline_clicks_last_24h),
+    "4_ad_fatigue_users": ("user_campaign_stats", None, pipeline_ad_fatigue),
+    "5_top_categories": ("impressions", "user_id", pipeline_top_categories),
 }
 
-for name, data in queries.items():
-    with open(os.path.join(results_dir, f"{name}.json"), "w") as f:
-        json.dump(data, f, default=str, indent=2)
+# аргументи за замовчуванням (ті самі, що раніше були захардкоджені)
+DEFAULT_USERS = {"1_all_interactions": [475], "2_last_5_sessions": [933], "5_top_categories": [436039]}
+DEFAULT_ADVERTISERS = ["Advertiser_47"]
+
+
+def projection_stage(fields):
+    """Фінальний $project: тільки потрібні поля результату (_id - тільки якщо його вказано)"""
+    return {"$project": {"_id": int("_id" in fields), **{field: 1 for field in fields if field != "_id"}}}
+
+
+def make_task(name, value=None, now=REFERENCE_TIME, fields=None):
+    """(назва запиту, параметри, pipeline) для одного значення параметра запиту"""
+    _, param, build = QUERIES[name]
+    if param is None:
+        params, pipeline = {}, build()
+    elif name == "3_clicks_last_24h":
+        params, pipeline = {param: value}, build(value, now)
+    else:
+        params, pipeline = {param: value}, build(value)
+    if fields:
+        pipeline.append(projection_stage(fields))
+    return name, params, pipeline
+
+
+def plan_tasks(queries, users=None, advertisers=None, now=REFERENCE_TIME, fields=None):
+    """Завдання: по одному на кожен запит і user_id / рекламодавця. users і advertisers можуть бути
+    ітераторами (напр. рядками файлу): кожне значення читається один раз для всіх запитів"""
+    by_param = {param: [name for name in queries if QUERIES[name][1] == param] for _, param, _ in QUERIES.values()}
+
+    for name in by_param[None]:
+        yield make_task(name, fields=fields)
+
+    for advertiser in advertisers if advertisers is not None else DEFAULT_ADVERTISERS:
+        for name in by_param["advertiser_name"]:
+            yield make_task(name, advertiser, now, fields)
+
+    if users is None:
+        for name in by_param["user_id"]:
+            for user_id in DEFAULT_USERS[name]:
+                yield make_task(name, user_id, now, fields)
+        return
+    for user_id in users:
+        for name in by_param["user_id"]:
+            yield make_task(name, user_id, now, fields)
+
+
+class NdjsonWriter:
+    """Один JSON-документ на рядок. Потоки пишуть у спільний файл під блокуванням, результати
+    курсора одразу йдуть у файл і не накопичуються в пам'яті"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w")
+        self.lock = threading.Lock()
+        self.rows = 0
+
+    def write(self, document):
+        line = json.dumps(document, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.rows += 1
+
+    def close(self):
+        self.file.close()
+
+
+def run_task(db, name, params, pipeline, writer, batch_size, allow_disk_use):
+    """Виконує pipeline і пише документи в writer по мірі читання курсора"""
+    collection = QUERIES[name][0]
+    cursor = db[collection].aggregate(pipeline, batchSize=batch_size, allowDiskUse=allow_disk_use)
+    with cursor:
+        for document in cursor:
+            # параметри запиту в кожному рядку: результати різних користувачів в одному файлі
+            writer.write({**params, **document})
+
+
+def run_queries(
+    db,
+    tasks,
+    out_dir,
+    workers=8,
+    batch_size=1000,
+    allow_disk_use=False,
+    window=None,
+):
+    """Виконує завдання plan_tasks на пулі потоків (MongoClient потокобезпечний, у кожного потоку
+    своє з'єднання з пулу) і пише результати в out_dir/{назва запиту}.ndjson.
+    Одночасно в черзі не більше window (за замовчуванням workers * 2) завдань, тому 100k користувачів
+    не створюють 100k futures. Повертає {назва запиту: (документів, запитів, невдалих запитів)}"""
+    os.makedirs(out_dir, exist_ok=True)
+    window = window or workers * 2
+    writers = {}
+    stats = {}
+    pending = {}
+
+    def collect(done):
+        for future in done:
+            name, params = pending.pop(future)
+            try:
+                future.result()
+            except Exception as err:
+                print(f"Query {name} {params} failed: {err}")
+                stats[name][2] += 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for name, params, pipeline in tasks:
+                if name not in writers:
+                    writers[name] = NdjsonWriter(os.path.join(out_dir, f"{name}.ndjson"))
+                    stats[name] = [0, 0, 0]
+                stats[name][1] += 1
+                future = pool.submit(
+                    run_task, db, name, params, pipeline, writers[name], batch_size, allow_disk_use
+                )
+                pending[future] = (name, params)
+
+                if len(pending) >= window:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            collect(wait(pending).done)
+    finally:
+        for name, writer in writers.items():
+            writer.close()
+            stats[name][0] = writer.rows
+
+    return {name: tuple(values) for name, values in stats.items()}
+
+
+def read_values(values, path, cast=str):
+    """Значення з аргументів командного рядка або з файлу (одне значення на рядок, читається ліниво)"""
+    if path:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield cast(line.strip())
+    elif values:
+        yield from (cast(value) for value in values)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", nargs="+", choices=QUERIES, default=list(QUERIES))
+    parser.add_argument("--users", nargs="+", help="User IDs for the per-user queries (1, 2, 5)")
+    parser.add_argument("--users-file", help="File with one user ID per line")
+    parser.add_argument("--advertisers", nargs="+", help="Advertiser names for the last-24h clicks query (3)")
+    parser.add_argument("--advertisers-file", help="File with one advertiser name per line")
+    parser.add_argument("--workers", help="Number of concurrent queries", type=int, default=8)
+    parser.add_argument("--batch-size", help="Cursor batchSize (documents per getMore)", type=int, default=1000)
+    parser.add_argument("--allow-disk-use", help="Let $group/$sort spill to disk", action="store_true")
+    parser.add_argument("--fields", nargs="+", help="Keep only these fields of every result document")
+    parser.add_argument(
+        "--now",
+        help="Reference time for the last-24h query, YYYY-MM-DDTHH:MM:SS",
+        type=datetime.fromisoformat,
+        default=REFERENCE_TIME,
+    )
+    parser.add_argument("--out", help="Directory for NDJSON results", default="/app/results")
+    args = parser.parse_args()
+
+    # без --users / --advertisers - аргументи за замовчуванням
+    users = read_values(args.users, args.users_file, int) if args.users or args.users_file else None
+    advertisers = (
+        read_values(args.advertisers, args.advertisers_file) if args.advertisers or args.advertisers_file else None
+    )
+    tasks = plan_tasks(
+        args.queries,
+        users=users,
+        advertisers=advertisers,
+        now=args.now,
+        fields=args.fields,
+    )
 
-print("Queries executed and results saved in 'results/'")
+    client = MongoClient(MONGO_URI, maxPoolSize=max(args.workers, 100))
+    start = time.perf_counter()
+    try:
+        stats = run_queries(
+            client["ad_analytics"],
+            tasks,
+            args.out,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            allow_disk_use=args.allow_disk_use,
+        )
+    finally:
+        client.close()
+    duration = time.perf_counter() - start
 
+    for name, (rows, queries, failed) in stats.items():
+        print(f"{name}: {queries} queries, {rows} documents, {failed} failed")
+    total = sum(queries for _, queries, _ in stats.values())
+    print(f"{total} queries in {duration:.2f}s ({total / duration if duration else 0:,.0f} queries/sec)")
+    print(f"Results saved as NDJSON in '{args.out}'")
@@ -0,0 +1,451 @@
+# etl/staging.py
+# Проміжний (staging) шар: сирі CSV один раз конвертуються в типізовані Parquet файли.
+# Події розбиті на партиції по даті (events/event_date=YYYY-MM-DD/), TargetingCriteria вже розібраний,
+# дати - datetime/date, WasClicked - bool, гроші - decimal.
+# transform_load.py, load_to_mongo.py та load_to_cassandra.py читають звідси тільки потрібні колонки
+# і партиції, тому CSV парситься один раз на файл, а не для кожного сховища окремо
+
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import os
+import re
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from etl_state import file_fingerprint
+
+DATA_DIR = os.environ.get("ETL_DATA_DIR", "/data")
+EVENTS_CSV = os.environ.get("ETL_EVENTS_CSV", os.path.join(DATA_DIR, "ad_events_short.csv"))
+USERS_CSV = os.path.join(DATA_DIR, "users.csv")
+CAMPAIGNS_CSV = os.path.join(DATA_DIR, "campaigns.csv")
+STAGING_DIR = os.environ.get("ETL_STAGING_DIR", os.path.join(DATA_DIR, "staging"))
+
+COUNTRIES = ["USA", "UK", "Germany", "India", "Australia"]
+
+# TargetingCriteria в ad_events не взятий в лапки, тому рядок даних має 20 колонок,
+# а заголовок - 18. Заголовок пропускаємо і задаємо назви самі
+EVENT_COLUMNS = [
+    "EventID",
+    "AdvertiserName",
+    "CampaignName",
+    "CampaignStartDate",
+    "CampaignEndDate",
+    "TargetingAge",
+    "TargetingInterest",
+    "TargetingCountry",
+    "AdSlotSize",
+    "UserID",
+    "Device",
+    "Location",
+    "Timestamp",
+    "BidAmount",
+    "AdCost",
+    "WasClicked",
+    "ClickTimestamp",
+    "AdRevenue",
+    "Budget",
+    "RemainingBudget",
+]
+
+MONEY = pa.decimal128(10, 2)
+BUDGET = pa.decimal128(15, 2)
+TARGETING_FIELDS = [
+    ("TargetingAgeMin", pa.int32()),
+    ("TargetingAgeMax", pa.int32()),
+    ("TargetingCountry", pa.string()),
+    ("TargetingInterests", pa.list_(pa.string())),
+]
+
+EVENT_SCHEMA = pa.schema(
+    [
+        ("EventID", pa.string()),
+        ("AdvertiserName", pa.string()),
+        ("CampaignName", pa.string()),
+        ("CampaignStartDate", pa.date32()),
+        ("CampaignEndDate", pa.date32()),
+        *TARGETING_FIELDS,
+        ("AdSlotSize", pa.string()),
+        ("UserID", pa.int64()),
+        ("Device", pa.string()),
+        ("Location", pa.string()),
+        ("Timestamp", pa.timestamp("s")),
+        ("BidAmount", MONEY),
+        ("AdCost", MONEY),
+        ("WasClicked", pa.bool_()),
+        ("ClickTimestamp", pa.timestamp("s")),
+        ("AdRevenue", MONEY),
+        ("Budget", BUDGET),
+        ("RemainingBudget", BUDGET),
+    ]
+)
+
+USER_SCHEMA = pa.schema(
+    [
+        ("UserID", pa.int64()),
+        ("Age", pa.int32()),
+        ("Gender", pa.string()),
+        ("Location", pa.string()),
+        ("Interests", pa.string()),
+        ("SignupDate", pa.date32()),
+    ]
+)
+
+CAMPAIGN_SCHEMA = pa.schema(
+    [
+        ("CampaignID", pa.int64()),
+        ("AdvertiserName", pa.string()),
+        ("CampaignName", pa.string()),
+        ("CampaignStartDate", pa.date32()),
+        ("CampaignEndDate", pa.date32()),
+        ("TargetingCriteria", pa.string()),
+        *TARGETING_FIELDS,
+        ("AdSlotSize", pa.string()),
+        ("Budget", BUDGET),
+        ("RemainingBudget", BUDGET),
+    ]
+)
+
+# суми читаються з CSV як текст і переводяться в decimal без проміжного float
+MONEY_COLUMNS = ["BidAmount", "AdCost", "AdRevenue", "Budget", "RemainingBudget"]
+
+
+def parse_targeting_criteria(criteria_str):
+    """Парсинг TargetingCriteria (Age XX-YY, Country, Interest)"""
+    age_min, age_max, country, interests = None, None, None, []
+
+    age_match = re.search(r"Age (\d+)-(\d+)", criteria_str)
+    if age_match:
+        age_min = int(age_match.group(1))
+        age_max = int(age_match.group(2))
+
+    for c in COUNTRIES:
+        if c in criteria_str:
+            country = c
+            break
+
+    parts = [part.strip() for part in criteria_str.split(",")]
+    for part in parts:
+        if not part.startswith("Age") and part not in COUNTRIES and part != "":
+            interests.append(part)
+
+    return age_min, age_max, country, interests
+
+
+def targeting_frame(criteria, parsed=None):
+    """Розібраний TargetingCriteria для кожного рядка (колонки TargetingAgeMin, TargetingAgeMax,
+    TargetingCountry, TargetingInterests). parsed - готовий словник {рядок: результат парсингу},
+    інакше кожен унікальний рядок парситься тут один раз"""
+    if parsed is None:
+        parsed = {value: parse_targeting_criteria(value) for value in criteria.dropna().unique()}
+    parsed = criteria.map(parsed)
+    return pd.DataFrame(
+        {
+            "TargetingAgeMin": pd.to_numeric(parsed.str[0]).astype("Int64"),
+            "TargetingAgeMax": pd.to_numeric(parsed.str[1]).astype("Int64"),
+            "TargetingCountry": parsed.str[2],
+            "TargetingInterests": parsed.str[3],
+        },
+        index=criteria.index,
+    )
+
+
+# ------------- Reading CSV ----------------
+
+def iter_events(path=EVENTS_CSV, chunksize=None, usecols=None, skip_rows=0, dtype=None):
+    """Читання ad_events частинами по chunksize рядків (без chunksize - один DataFrame на весь файл).
+    skip_rows - кількість рядків даних, вже прочитаних попереднім запуском"""
+    with open(path, newline="") as f:
+        # заголовок + вже прочитані рядки пропускаємо без парсингу
+        for _ in itertools.islice(f, skip_rows + 1):
+            pass
+        reader = pd.read_csv(
+            f,
+            header=None,
+            names=EVENT_COLUMNS,
+            usecols=usecols,
+            chunksize=chunksize,
+            dtype=dtype,
+        )
+        if chunksize:
+            yield from reader
+        else:
+            yield reader
+
+
+# ------------- CSV -> Parquet ----------------
+
+def to_table(frame, schema):
+    """DataFrame -> pyarrow Table з типами schema (текст -> decimal, datetime -> date і т.д.)"""
+    return pa.Table.from_pandas(frame[schema.names], preserve_index=False).cast(schema)
+
+
+def convert_events(df_events):
+    criteria = (
+        df_events["TargetingAge"].astype(str)
+        + ","
+        + df_events["TargetingInterest"].astype(str)
+        + ","
+        + df_events["TargetingCountry"].astype(str)
+    )
+    return df_events.drop(columns=["TargetingAge", "TargetingInterest", "TargetingCountry"]).assign(
+        **targeting_frame(criteria),
+        CampaignStartDate=pd.to_datetime(df_events["CampaignStartDate"]),
+        CampaignEndDate=pd.to_datetime(df_events["CampaignEndDate"]),
+        Timestamp=pd.to_datetime(df_events["Timestamp"]),
+        ClickTimestamp=pd.to_datetime(df_events["ClickTimestamp"], errors="coerce"),
+        WasClicked=df_events["WasClicked"].astype(str).str.lower().eq("true"),
+    )
+
+
+def convert_users(df_users):
+    return df_users.assign(SignupDate=pd.to_datetime(df_users["SignupDate"]))
+
+
+def convert_campaigns(df_campaigns):
+    return df_campaigns.assign(
+        **targeting_frame(df_campaigns["TargetingCriteria"]),
+        CampaignStartDate=pd.to_datetime(df_campaigns["CampaignStartDate"]),
+        CampaignEndDate=pd.to_datetime(df_campaigns["CampaignEndDate"]),
+    )
+
+
+def source_id(path):
+    """Коротке стабільне ім'я файлу-джерела для назв Parquet файлів"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{hashlib.md5(os.path.abspath(path).encode()).hexdigest()[:8]}"
+
+
+def load_manifest(staging_dir=STAGING_DIR):
+    path = os.path.join(staging_dir, "_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, staging_dir=STAGING_DIR):
+    os.makedirs(staging_dir, exist_ok=True)
+    path = os.path.join(staging_dir, "_manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def stage_events(path, manifest, chunksize=None, staging_dir=STAGING_DIR):
+    """ad_events CSV -> events/event_date=YYYY-MM-DD/<джерело>-<перший рядок>.parquet.
+    Незмінений файл пропускається; дописаний файл дочитується з місця, де зупинився
+    попередній запуск (нові рядки йдуть в окремі файли тих самих партицій).
+    Повертає кількість нових рядків"""
+    fingerprint = file_fingerprint(path)
+    entry = manifest.get(path)
+    if entry and entry["fingerprint"] == fingerprint:
+        return 0
+
+    skip_rows = 0
+    files = []
+    if entry and os.path.getsize(path) >= int(entry["fingerprint"].split(":")[0]):
+        skip_rows, files = entry["rows"], entry["files"]
+    elif entry:
+        # файл перезаписали, а не дописали - старі партиції цього джерела видаляємо
+        for name in entry["files"]:
+            if os.path.exists(os.path.join(staging_dir, name)):
+                os.remove(os.path.join(staging_dir, name))
+
+    # один файл на (джерело, день): group_by по даті в кожній частині дописує row group
+    writers = {}
+    rows = skip_rows
+    dtype = dict.fromkeys(MONEY_COLUMNS, str)
+    try:
+        for df_events in iter_events(path, chunksize, skip_rows=skip_rows, dtype=dtype):
+            events = convert_events(df_events)
+            for day, part in events.groupby(events["Timestamp"].dt.strftime("%Y-%m-%d")):
+                if day not in writers:
+                    name = os.path.join("events", f"event_date={day}", f"{source_id(path)}-{skip_rows}.parquet")
+                    os.makedirs(os.path.dirname(os.path.join(staging_dir, name)), exist_ok=True)
+                    writers[day] = pq.ParquetWriter(os.path.join(staging_dir, name), EVENT_SCHEMA)
+                    files.append(name)
+                writers[day].write_table(to_table(part, EVENT_SCHEMA))
+            rows += len(df_events)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    manifest[path] = {"fingerprint": fingerprint, "rows": rows, "files": sorted(set(files))}
+    save_manifest(manifest, staging_dir)
+    return rows - skip_rows
+
+
+def stage_table(path, name, convert, schema, manifest, chunksize=None, staging_dir=STAGING_DIR):
+    """users.csv / campaigns.csv -> один Parquet файл, перезаписується тільки якщо CSV змінився"""
+    fingerprint = file_fingerprint(path)
+    entry = manifest.get(path)
+    if entry and entry["fingerprint"] == fingerprint:
+        return 0
+
+    os.makedirs(staging_dir, exist_ok=True)
+    target = os.path.join(staging_dir, name)
+    dtype = {column: str for column in MONEY_COLUMNS if column in schema.names}
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=dtype)
+    rows = 0
+    with pq.ParquetWriter(target + ".tmp", schema) as writer:
+        for df in reader if chunksize else [reader]:
+            writer.write_table(to_table(convert(df), schema))
+            rows += len(df)
+    os.replace(target + ".tmp", target)
+
+    manifest[path] = {"fingerprint": fingerprint, "rows": rows, "files": [name]}
+    save_manifest(manifest, staging_dir)
+    return rows
+
+
+def stage_all(events_pattern=EVENTS_CSV, chunksize=None, staging_dir=STAGING_DIR):
+    """Конвертація всіх джерел, які змінились з минулого запуску. Без нових даних - нічого не робить"""
+    manifest = load_manifest(staging_dir)
+    staged = {}
+    if os.path.exists(USERS_CSV):
+        staged[USERS_CSV] = stage_table(
+            USERS_CSV, "users.parquet", convert_users, USER_SCHEMA, manifest, chunksize, staging_dir
+        )
+    if os.path.exists(CAMPAIGNS_CSV):
+        staged[CAMPAIGNS_CSV] = stage_table(
+            CAMPAIGNS_CSV, "campaigns.parquet", convert_campaigns, CAMPAIGN_SCHEMA, manifest, None, staging_dir
+        )
+    for path in sorted(glob.glob(events_pattern)):
+        staged[path] = stage_events(path, manifest, chunksize, staging_dir)
+
+    for path, rows in staged.items():
+        print(f"Staged {path}: {rows} new rows" if rows else f"Staged {path}: unchanged")
+    return staged
+
+
+# ------------- Reading Parquet ----------------
+
+def to_frame(table):
+    """pyarrow Table -> DataFrame; цілі з NULL лишаються цілими (Int64), а не float"""
+    return table.to_pandas(
+        types_mapper={pa.int32(): pd.Int64Dtype(), pa.int64(): pd.Int64Dtype()}.get
+    )
+
+
+def list_partitions(start=None, end=None, staging_dir=STAGING_DIR):
+    """[(день, шлях до партиції)] з фільтром по даті - відсікання партицій без читання файлів"""
+    partitions = []
+    for path in sorted(glob.glob(os.path.join(staging_dir, "events", "event_date=*"))):
+        day = date.fromisoformat(path.rsplit("=", 1)[1])
+        if (start is None or day >= start) and (end is None or day <= end):
+            partitions.append((day, path))
+    return partitions
+
+
+def partition_fingerprint(path):
+    """Хеш назв, розмірів і часу зміни файлів партиції: змінюється, коли в партицію дописали дані"""
+    digest = hashlib.md5()
+    for name in sorted(os.listdir(path)):
+        stat = os.stat(os.path.join(path, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def read_partition_table(path, columns=None):
+    return ds.dataset(path, format="parquet", schema=EVENT_SCHEMA).to_table(columns=columns)
+
+
+def iter_partition(path, columns=None, chunksize=None, skip_rows=0):
+    """DataFrame-и однієї партиції по chunksize рядків (без chunksize - вся партиція одразу).
+    Читаються тільки columns"""
+    table = read_partition_table(path, columns).slice(skip_rows)
+    if not chunksize:
+        yield to_frame(table)
+        return
+    for batch in table.to_batches(max_chunksize=chunksize):
+        yield to_frame(pa.Table.from_batches([batch], schema=table.schema))
+
+
+def read_events(columns=None, start=None, end=None, staging_dir=STAGING_DIR):
+    """Всі події за період одним DataFrame (тільки columns і тільки потрібні партиції)"""
+    frames = [
+        to_frame(read_partition_table(path, columns))
+        for _, path in list_partitions(start, end, staging_dir)
+    ]
+    if not frames:
+        return to_frame(EVENT_SCHEMA.empty_table().select(columns or EVENT_SCHEMA.names))
+    return pd.concat(frames, ignore_index=True)
+
+
+def list_event_files(staging_dir=STAGING_DIR):
+    """Файли подій відносно staging_dir. Файли не змінюються після запису (нові рядки - нові файли),
+    тому за ними можна відстежувати, які дані вже оброблені"""
+    pattern = os.path.join(staging_dir, "events", "event_date=*", "*.parquet")
+    return sorted(os.path.relpath(path, staging_dir) for path in glob.glob(pattern))
+
+
+def read_event_files(files, columns=None, staging_dir=STAGING_DIR):
+    paths = [os.path.join(staging_dir, name) for name in files]
+    return to_frame(ds.dataset(paths, format="parquet", schema=EVENT_SCHEMA).to_table(columns=columns))
+
+
+def iter_users(columns=None, chunksize=None, staging_dir=STAGING_DIR):
+    parquet_file = pq.ParquetFile(os.path.join(staging_dir, "users.parquet"))
+    if not chunksize:
+        yield to_frame(parquet_file.read(columns=columns))
+        return
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield to_frame(pa.Table.from_batches([batch]))
+
+
+def read_campaigns(columns=None, staging_dir=STAGING_DIR):
+    return to_frame(pq.read_table(os.path.join(staging_dir, "campaigns.parquet"), columns=columns))
+
+
+# ------------- Processed partitions ----------------
+# Завантажувачі, що не пишуть в MySQL, зберігають відбиток кожної обробленої партиції тут
+
+def load_processed(consumer, staging_dir=STAGING_DIR):
+    path = os.path.join(staging_dir, "_processed", f"{consumer}.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_processed(consumer, processed, staging_dir=STAGING_DIR):
+    path = os.path.join(staging_dir, "_processed", f"{consumer}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(processed, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def pending_partitions(partitions, processed):
+    """Партиції, яких ще не було або в які дописали дані після останньої обробки"""
+    return [
+        (day, path) for day, path in partitions
+        if processed.get(os.path.basename(path)) != partition_fingerprint(path)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        help="Event CSV file or glob pattern, e.g. '/data/events/*.csv'",
+        type=str,
+        default=EVENTS_CSV,
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help="Read CSV files in chunks of N rows (default: whole file at once)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument("--staging-dir", type=str, default=STAGING_DIR)
+    args = parser.parse_args()
+
+    stage_all(args.events, args.chunk_size, args.staging_dir)
@@ -1,9 +1,29 @@
 # etl/transform_load.py
 
+import argparse
+import glob
+import os
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
 import pandas as pd
 import mysql.connector
 from mysql.connector import errorcode
-import re
+
+import staging
+from dimension_cache import DimensionCache
+from etl_metrics import PROFILE, REPORT_DIR, RunReport
+from etl_state import ensure_manifest, file_fingerprint, get_entry, is_unchanged, save_entry
+from staging import (  # noqa: F401 - EVENT_COLUMNS імпортує benchmarks/bench_row_building.py
+    CAMPAIGNS_CSV,
+    EVENT_COLUMNS,
+    EVENTS_CSV,
+    USERS_CSV,
+    parse_targeting_criteria,
+    targeting_frame,
+)
 
 DB_CONFIG = {
     "user": "root",
@@ -13,278 +33,770 @@ DB_CONFIG = {
     "database": "ad_analytics",
 }
 
+def explode_user_interests(interests):
+    """Інтереси користувачів "A, B, C" -> Series (індекс рядка користувача -> назва інтересу)"""
+    return interests.str.split(",").explode().str.strip().dropna()
+
 
-def parse_targeting_criteria(criteria_str):
-    """Парсинг TargetingCriteria (Age XX-YY, Country, Interest)"""
-    age_min, age_max, country, interests = None, None, None, []
+def to_mysql_datetime(values, errors="raise"):
+    """Векторний парсинг дат у формат DATETIME (NaT -> NULL)"""
+    return pd.to_datetime(values, errors=errors).dt.strftime("%Y-%m-%d %H:%M:%S")
 
-    age_match = re.search(r"Age (\d+)-(\d+)", criteria_str)
-    if age_match:
-        age_min = int(age_match.group(1))
-        age_max = int(age_match.group(2))
 
-    countries = ["USA", "UK", "Germany", "India", "Australia"]
-    for c in countries:
-        if c in criteria_str:
-            country = c
-            break
+def to_params(df, columns):
+    """Колонки DataFrame -> список кортежів для executemany (NaN -> NULL, numpy -> python типи)"""
+    frame = df[columns].astype(object)
+    frame = frame.where(frame.notna(), None)
+    return list(frame.itertuples(index=False, name=None))
 
-    parts = [part.strip() for part in criteria_str.split(",")]
-    for part in parts:
-        if not part.startswith("Age") and part not in countries and part != "":
-            interests.append(part)
 
-    return age_min, age_max, country, interests
+# ------------- Reading sources ----------------
+# Джерело - або сирий CSV, або staging (Parquet): партиції подій - це директорії
 
+def iter_events(path=EVENTS_CSV, chunksize=None, usecols=None, skip_rows=0):
+    """Читання подій частинами по chunksize рядків (без chunksize - один DataFrame на весь файл).
+    skip_rows - кількість рядків даних, вже завантажених попереднім запуском"""
+    if os.path.isdir(path):
+        yield from staging.iter_partition(path, usecols, chunksize, skip_rows)
+    else:
+        yield from staging.iter_events(path, chunksize, usecols, skip_rows)
 
-# ------------- Loading CSV ----------------
 
-print("Loading CSV files...")
+def read_campaigns(cache, staged=False):
+    if staged:
+        # TargetingCriteria розібраний при конвертації в Parquet
+        return staging.read_campaigns()
+    df_campaigns = pd.read_csv(CAMPAIGNS_CSV)
+    criteria = df_campaigns["TargetingCriteria"]
+    return df_campaigns.join(
+        targeting_frame(criteria, cache.parse_targeting(criteria.dropna(), parse_targeting_criteria))
+    )
 
-df_events = pd.read_csv("/data/ad_events_short.csv", skiprows=[0], header=None)
 
-df_events.columns = [
-    "EventID",
-    "AdvertiserName",
+def iter_users(chunksize=None, usecols=None, staged=False):
+    """Читання users частинами по chunksize рядків"""
+    if staged:
+        yield from staging.iter_users(usecols, chunksize)
+        return
+    reader = pd.read_csv(USERS_CSV, usecols=usecols, chunksize=chunksize)
+    if chunksize:
+        yield from reader
+    else:
+        yield reader
+
+
+def collect_dimensions(df_campaigns, event_sources, load_users, chunksize=None, staged=False):
+    """Попередній прохід по файлах: збираємо тільки унікальні значення довідників,
+    щоб пам'ять залежала від кількості рекламодавців/локацій/інтересів, а не від кількості подій.
+    Порядок рекламодавців такий самий, як при завантаженні всього файлу одразу.
+    df_campaigns = None / load_users = False - файл не змінився з останнього запуску"""
+    advertiser_names = {}
+    locations = set()
+    all_interests = set()
+
+    for path, skip_rows in event_sources:
+        for chunk in iter_events(path, chunksize, ["AdvertiserName", "Location"], skip_rows):
+            advertiser_names.update(dict.fromkeys(chunk["AdvertiserName"].dropna()))
+            locations.update(chunk["Location"].dropna().unique())
+
+    if df_campaigns is not None:
+        advertiser_names.update(dict.fromkeys(df_campaigns["AdvertiserName"].dropna()))
+
+    if load_users:
+        for chunk in iter_users(chunksize, ["Location", "Interests"], staged):
+            locations.update(chunk["Location"].dropna().unique())
+            # from users
+            all_interests.update(explode_user_interests(chunk["Interests"]).unique())
+
+    # from campaigns
+    if df_campaigns is not None:
+        all_interests.update(df_campaigns["TargetingInterests"].explode().dropna().unique())
+
+    return list(advertiser_names), locations, all_interests
+
+
+def plan_sources(cursor, event_files, incremental):
+    """Які файли читати. В інкрементальному режимі файли, що не змінились з останнього
+    запуску, пропускаються, а файли подій дочитуються з місця, де зупинився попередній запуск
+    (файли подій тільки дописуються, тому вже завантажені рядки не змінюються)"""
+    fingerprints = {path: file_fingerprint(path) for path in [USERS_CSV, CAMPAIGNS_CSV]}
+    fingerprints.update(
+        (path, staging.partition_fingerprint(path) if os.path.isdir(path) else file_fingerprint(path))
+        for path in event_files
+    )
+    if not incremental:
+        return True, True, [(path, 0) for path in event_files], fingerprints
+
+    load_users = not is_unchanged(get_entry(cursor, USERS_CSV), fingerprints[USERS_CSV])
+    load_campaigns = not is_unchanged(get_entry(cursor, CAMPAIGNS_CSV), fingerprints[CAMPAIGNS_CSV])
+
+    event_sources = []
+    for path in event_files:
+        entry = get_entry(cursor, path)
+        if is_unchanged(entry, fingerprints[path]):
+            continue
+        skip_rows = entry["rows_loaded"] if entry else 0
+        if entry and os.path.isdir(path) and entry["fingerprint"] != fingerprints[path]:
+            # в партицію staging додали файли - порядок рядків інший, читаємо її заново
+            skip_rows = 0
+        elif entry and not os.path.isdir(path) and os.path.getsize(path) < int(entry["fingerprint"].split(":")[0]):
+            # файл перезаписали, а не дописали - читаємо заново
+            skip_rows = 0
+        event_sources.append((path, skip_rows))
+
+    return load_users, load_campaigns, event_sources, fingerprints
+
+
+# ------------- Building rows ----------------
+# Рядки для executemany будуються колонками (map/merge/explode), без iterrows()
+
+USER_COLUMNS = ["UserID", "Age", "Gender", "LocationID", "SignupDate"]
+CAMPAIGN_COLUMNS = [
+    "AdvertiserID",
     "CampaignName",
     "CampaignStartDate",
     "CampaignEndDate",
-    "TargetingAge",
-    "TargetingInterest",
-    "TargetingCountry",
+    "Budget",
+    "RemainingBudget",
+    "TargetingAgeMin",
+    "TargetingAgeMax",
+    "TargetingLocationID",
     "AdSlotSize",
+]
+AD_EVENT_COLUMNS = [
+    "EventID",
+    "CampaignID",
     "UserID",
     "Device",
-    "Location",
     "Timestamp",
     "BidAmount",
     "AdCost",
+    "AdRevenue",
     "WasClicked",
     "ClickTimestamp",
-    "AdRevenue",
-    "Budget",
-    "RemainingBudget",
 ]
 
-df_users = pd.read_csv("/data/users.csv")
-df_campaigns = pd.read_csv("/data/campaigns.csv")
 
-print("Connecting to database...")
+def build_user_frames(df_users, location_map, interest_map):
+    """DataFrame-и з колонками USER_COLUMNS та (UserID, InterestID)"""
+    users = df_users.assign(
+        LocationID=df_users["Location"].map(location_map).astype("Int64")
+    )
 
-try:
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
+    interests = explode_user_interests(df_users["Interests"])
+    user_interests = pd.DataFrame(
+        {
+            "UserID": df_users["UserID"].loc[interests.index],
+            "InterestID": interests.map(interest_map).astype("Int64"),
+        }
+    ).dropna()
 
-    conn.start_transaction()
-    print("Connected to DB. Transaction started.")
+    return users[USER_COLUMNS], user_interests
 
-    # ------------ Advertisers ----------------
-    print("Import to Advertisers")
-    advertiser_names = (
-        pd.concat([df_events["AdvertiserName"], df_campaigns["AdvertiserName"]])
-        .dropna()
-        .unique()
-        .tolist()
-    )
-    cursor.executemany(
-        "INSERT IGNORE INTO Advertisers (AdvertiserName) VALUES (%s)",
-        [(name,) for name in advertiser_names],
+
+def build_user_rows(df_users, location_map, interest_map):
+    users, user_interests = build_user_frames(df_users, location_map, interest_map)
+    return to_params(users, USER_COLUMNS), to_params(user_interests, ["UserID", "InterestID"])
+
+
+def build_campaign_rows(df_campaigns, advertiser_map, location_map):
+    """Параметри INSERT INTO Campaigns у порядку рядків df_campaigns (з колонками targeting_frame)"""
+    campaigns = df_campaigns.assign(
+        AdvertiserID=df_campaigns["AdvertiserName"].map(advertiser_map).astype("Int64"),
+        TargetingLocationID=df_campaigns["TargetingCountry"].map(location_map).astype("Int64"),
     )
-    conn.commit()
+    return to_params(campaigns, CAMPAIGN_COLUMNS)
 
-    cursor.execute("SELECT AdvertiserID, AdvertiserName FROM Advertisers")
-    advertiser_map = {
-        advertiser_name: advertiser_id
-        for advertiser_id, advertiser_name in cursor.fetchall()
-    }
 
-    # ------------ Locations ----------------
-    unique_locations = set(df_users["Location"].dropna().unique()) | set(df_events["Location"].dropna().unique())
+def build_campaign_interest_rows(df_campaigns, campaign_map, interest_map):
+    """Пари (CampaignID, InterestID) для всіх кампаній одразу"""
+    interests = df_campaigns["TargetingInterests"].explode().dropna()
+    campaign_interests = pd.DataFrame(
+        {
+            "CampaignID": df_campaigns["CampaignName"].loc[interests.index].map(campaign_map).astype("Int64"),
+            "InterestID": interests.map(interest_map).astype("Int64"),
+        }
+    ).dropna()
+    return to_params(campaign_interests, ["CampaignID", "InterestID"])
 
-    location_map = {}
 
-    print("Import to Locations")
+def build_ad_event_frame(df_events, campaign_map):
+    """DataFrame з колонками AD_EVENT_COLUMNS + кількість пропущених подій"""
+    campaign_ids = pd.DataFrame(
+        list(campaign_map.items()), columns=["CampaignName", "CampaignID"]
+    )
+    events = df_events.merge(campaign_ids, on="CampaignName", how="left")
+
+    unknown = events["CampaignID"].isna()
+    for event_id, campaign_name in events.loc[unknown, ["EventID", "CampaignName"]].itertuples(
+        index=False, name=None
+    ):
+        print(f"Skipping AdEvent {event_id} - unknown CampaignName: '{campaign_name}'")
+    skipped_events = int(unknown.sum())
+
+    events = events[~unknown]
+    events = events.assign(
+        CampaignID=events["CampaignID"].astype(int),
+        Timestamp=to_mysql_datetime(events["Timestamp"]),
+        WasClicked=events["WasClicked"].astype(str).str.lower().eq("true").astype(int),
+        ClickTimestamp=to_mysql_datetime(events["ClickTimestamp"], errors="coerce"),
+    )
 
-    for location in unique_locations:
-        cursor.execute("INSERT IGNORE INTO Locations (LocationName) VALUES (%s)", (location,))
-    conn.commit()
+    return events[AD_EVENT_COLUMNS], skipped_events
 
-    cursor.execute("SELECT LocationID, LocationName FROM Locations")
-    for location_id, name in cursor.fetchall():
-        location_map[name] = location_id
 
+def build_ad_event_rows(df_events, campaign_map):
+    events, skipped_events = build_ad_event_frame(df_events, campaign_map)
+    return to_params(events, AD_EVENT_COLUMNS), skipped_events
 
-    # ------------ Interests ----------------
-    print("Import to Interests")
-    all_interests = set()
 
-    # from users
-    for interests_str in df_users["Interests"].dropna():
-        interests = [i.strip() for i in interests_str.split(",")]
-        all_interests.update(interests)
+# ------------- Bulk load (LOAD DATA LOCAL INFILE) ----------------
 
-    # from campaigns
-    for criteria_str in df_campaigns["TargetingCriteria"].dropna():
-        _, _, _, interests = parse_targeting_criteria(criteria_str)
-        all_interests.update(interests)
-
-    # insert Interests
-    cursor.executemany(
-        "INSERT IGNORE INTO Interests (Name) VALUES (%s)",
-        [(interest,) for interest in all_interests],
-    )
-    conn.commit()
-
-    cursor.execute("SELECT InterestID, Name FROM Interests")
-    interest_map = {name: interest_id for interest_id, name in cursor.fetchall()}
-
-    # ------------ Users ----------------
-    print("Import to Users")
-    users_data = []
-    for _, row in df_users.iterrows():
-        users_data.append(
-            (
-                row["UserID"],
-                row["Age"],
-                row["Gender"],
-                location_map.get(row["Location"]),
-                row["SignupDate"],
-            )
-        )
-    cursor.executemany(
-        """
-        INSERT IGNORE INTO Users (UserID, Age, Gender, LocationID, SignupDate)
-        VALUES (%s, %s, %s, %s, %s)
-        """,
-        users_data,
-    )
-    conn.commit()
-
-    # ------------ UserInterests ----------------
-    print("Import to UserInterests")
-    user_interest_values = []
-    for _, row in df_users.iterrows():
-        user_id = row["UserID"]
-        interests = [i.strip() for i in row["Interests"].split(",")]
-        for interest in interests:
-            interest_id = interest_map.get(interest)
-            if interest_id:
-                user_interest_values.append((user_id, interest_id))
-
-    cursor.executemany(
-        "INSERT IGNORE INTO UserInterests (UserID, InterestID) VALUES (%s, %s)",
-        user_interest_values,
-    )
-    conn.commit()
+# Вторинні індекси AdEvents, які можна перебудувати після завантаження.
+# idx_campaign_id та idx_user_id не чіпаємо - на них тримаються FOREIGN KEY
+DEFERRED_AD_EVENT_INDEXES = {
+    "idx_was_clicked": "(WasClicked)",
+    "idx_timestamp": "(Timestamp)",
+    "idx_device_timestamp": "(Device, Timestamp)",
+}
 
-    # ------------ Campaigns ----------------
-    print("Import to Campaigns")
-    campaign_map = {}
 
-    for _, row in df_campaigns.iterrows():
-        advertiser_id = advertiser_map.get(row["AdvertiserName"])
-        age_min, age_max, country, interests = parse_targeting_criteria(
-            row["TargetingCriteria"]
-        )
-        targeting_location_id = location_map.get(country) if country else None
+def bulk_load(cursor, table, frame, ignore=False):
+    """Запис DataFrame у тимчасовий TSV і завантаження через LOAD DATA LOCAL INFILE.
+
+    LOCAL завжди працює як IGNORE: рядки з помилками не переривають завантаження, а відкидаються
+    з попередженням. Відкинуті дублікати (рядок уже є в таблиці) пропускаються, будь-яка інша причина
+    (FOREIGN KEY тощо) - IntegrityError, щоб транзакцію частини було відкочено.
+    Повертає кількість записаних рядків"""
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False, newline="") as f:
+        frame.to_csv(f, sep="\t", header=False, index=False, na_rep="\\N")
+        path = f.name
 
+    try:
         cursor.execute(
-            """
-            INSERT INTO Campaigns (
-                AdvertiserID, CampaignName, CampaignStartDate, CampaignEndDate,
-                Budget, RemainingBudget, TargetingAgeMin, TargetingAgeMax, TargetingLocationID, AdSlotSize
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            f"""
+            LOAD DATA LOCAL INFILE %s {"IGNORE" if ignore else ""} INTO TABLE {table}
+            FIELDS TERMINATED BY '\\t' OPTIONALLY ENCLOSED BY '"'
+            LINES TERMINATED BY '\\n'
+            ({", ".join(frame.columns)})
             """,
-            (
-                advertiser_id,
-                row["CampaignName"],
-                row["CampaignStartDate"],
-                row["CampaignEndDate"],
-                row["Budget"],
-                row["RemainingBudget"],
-                age_min,
-                age_max,
-                targeting_location_id,
-                row["AdSlotSize"],
-            ),
+            (path,),
         )
-        campaign_id = cursor.lastrowid
-        campaign_map[row["CampaignName"]] = campaign_id
-
-        # CampaignInterests
-        campaign_interest_values = []
-        for interest in interests:
-            interest_id = interest_map.get(interest)
-            if interest_id:
-                campaign_interest_values.append((campaign_id, interest_id))
-
-        cursor.executemany(
-            "INSERT IGNORE INTO CampaignInterests (CampaignID, InterestID) VALUES (%s, %s)",
-            campaign_interest_values,
+        loaded = cursor.rowcount
+    finally:
+        os.remove(path)
+
+    rejected = len(frame) - loaded
+    if rejected:
+        cursor.execute("SHOW WARNINGS")
+        warnings = cursor.fetchall()
+        errors = [(code, message) for _, code, message in warnings if code != errorcode.ER_DUP_ENTRY]
+        if errors or len(warnings) < rejected:
+            # без усіх попереджень (max_error_count) не можна перевірити, що відкинуті тільки дублікати
+            code, message = errors[0] if errors else (None, "not all rejected rows are reported in SHOW WARNINGS")
+            raise mysql.connector.errors.IntegrityError(
+                msg=f"LOAD DATA rejected {rejected} of {len(frame)} rows for {table}: {message}", errno=code
+            )
+    return loaded
+
+
+def drop_deferred_indexes(cursor):
+    """Видаляє вторинні індекси AdEvents перед завантаженням, повертає список видалених"""
+    cursor.execute(
+        """
+        SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'AdEvents'
+        """
+    )
+    existing = {name for (name,) in cursor.fetchall()}
+    dropped = [name for name in DEFERRED_AD_EVENT_INDEXES if name in existing]
+    if dropped:
+        print(f"Dropping AdEvents indexes until load is finished: {', '.join(dropped)}")
+        cursor.execute(
+            "ALTER TABLE AdEvents " + ", ".join(f"DROP INDEX {name}" for name in dropped)
         )
-    conn.commit()
+    return dropped
 
-    # ------------ AdEvents ----------------
 
-    print("Import to AdEvents")
-    ad_events_values = []
-    skipped_events = 0
+def restore_deferred_indexes(cursor, dropped):
+    """Одна ALTER TABLE на всі індекси - таблиця сканується один раз"""
+    if not dropped:
+        return
+    print(f"Rebuilding AdEvents indexes: {', '.join(dropped)}")
+    cursor.execute(
+        "ALTER TABLE AdEvents "
+        + ", ".join(f"ADD INDEX {name} {DEFERRED_AD_EVENT_INDEXES[name]}" for name in dropped)
+    )
 
-    for _, row in df_events.iterrows():
-        campaign_id = campaign_map.get(row["CampaignName"])
-        if campaign_id is None:
-            print(
-                f"Skipping AdEvent {row['EventID']} - unknown CampaignName: '{row['CampaignName']}'"
-            )
-            skipped_events += 1
-            continue
 
-        was_clicked = 1 if str(row["WasClicked"]).lower() == "true" else 0
-        click_timestamp = (
-            row["ClickTimestamp"]
-            if pd.notna(row["ClickTimestamp"]) and row["ClickTimestamp"] != ""
-            else None
-        )
+def set_bulk_session(cursor):
+    # вимикаються тільки перевірки унікальності вторинних індексів; FOREIGN KEY лишаються увімкненими -
+    # UserID подій ніде не звіряється з Users, і подія з невідомим користувачем має відхилятися,
+    # як і при звичайному INSERT (LOAD DATA LOCAL лише відкидає такий рядок, помилку з нього робить bulk_load)
+    cursor.execute("SET SESSION unique_checks = 0")
+    # попередження кожного відкинутого рядка потрібні bulk_load, щоб відрізнити дублікати від помилок
+    cursor.execute("SET SESSION max_error_count = 65535")
 
-        ad_events_values.append(
-            (
-                row["EventID"],
-                campaign_id,
-                row["UserID"],
-                row["Device"],
-                row["Timestamp"],
-                row["BidAmount"],
-                row["AdCost"],
-                row["AdRevenue"],
-                was_clicked,
-                click_timestamp,
-            )
-        )
 
-    cursor.executemany(
-        """
-        INSERT INTO AdEvents (
-            EventID, CampaignID, UserID, Device, Timestamp,
-            BidAmount, AdCost, AdRevenue, WasClicked, ClickTimestamp
-        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """,
-        ad_events_values,
-    )
-    conn.commit()
+# повторна вставка тієї самої події нічого не змінює, тому перезапуск і повтор частини безпечні
+AD_EVENTS_INSERT = """
+    INSERT INTO AdEvents (
+        EventID, CampaignID, UserID, Device, Timestamp,
+        BidAmount, AdCost, AdRevenue, WasClicked, ClickTimestamp
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE EventID = EventID
+"""
+
+
+def insert_ad_events(cursor, events, bulk=False):
+    """Повертає кількість записаних подій: у bulk-режимі без подій, які вже були в таблиці"""
+    if bulk:
+        return bulk_load(cursor, "AdEvents", events)
+    # INSERT з невідомим UserID/CampaignID падає сам, а повтор існуючої події нічого не змінює
+    cursor.executemany(AD_EVENTS_INSERT, to_params(events, AD_EVENT_COLUMNS))
+    return len(events)
 
-    print(f"Inserted {len(ad_events_values)} AdEvents. Skipped {skipped_events}.")
 
-    # ------------ Done ----------------
-    conn.commit()
-    print("ETL finished successfully. Transaction committed.")
+# ------------- Parallel AdEvents load ----------------
+# Кожен процес-воркер має своє з'єднання; одна частина (partition) = одна транзакція
 
-except mysql.connector.Error as err:
-    print(f"Error: {err}")
-    conn.rollback()
-    print("Transaction rolled back.")
+_worker_conn = None
+_worker_bulk = False
 
-finally:
-    if conn.is_connected():
+
+def _connect_worker():
+    conn = mysql.connector.connect(**DB_CONFIG, allow_local_infile=_worker_bulk)
+    if _worker_bulk:
+        cursor = conn.cursor()
+        set_bulk_session(cursor)
         cursor.close()
-        conn.close()
-        print("MySQL connection closed.")
+    return conn
+
+
+def _init_worker(bulk):
+    global _worker_conn, _worker_bulk
+    _worker_bulk = bulk
+    _worker_conn = _connect_worker()
+
+
+def load_partition(partition_id, events, retries):
+    """Вставка частини AdEvents у воркері. При помилці транзакція відкочується
+    і вся частина повторюється заново, тож частково записаних частин не буває.
+    Вставка ідемпотентна, тому повтор після втраченої відповіді на COMMIT теж безпечний"""
+    global _worker_conn
+    start = time.perf_counter()
+
+    for attempt in range(1, retries + 2):
+        try:
+            if not _worker_conn.is_connected():
+                _worker_conn = _connect_worker()
+            cursor = _worker_conn.cursor()
+            _worker_conn.start_transaction()
+            inserted = insert_ad_events(cursor, events, _worker_bulk)
+            _worker_conn.commit()
+            cursor.close()
+            return os.getpid(), inserted, time.perf_counter() - start
+        except mysql.connector.Error as err:
+            try:
+                _worker_conn.rollback()
+            except mysql.connector.Error:
+                pass
+            if attempt > retries:
+                raise
+            print(f"Partition {partition_id} failed (attempt {attempt}): {err}. Retrying...")
+            time.sleep(attempt)
+
+
+def load_ad_events_parallel(chunks, campaign_map, workers, batch_size, bulk=False, retries=3):
+    """Головний процес готує рядки, воркери вставляють частини по batch_size рядків.
+    Одночасно в черзі не більше workers * 2 частин, тому пам'ять обмежена"""
+    worker_stats = defaultdict(lambda: [0, 0.0])
+    failed_partitions = []
+    inserted_events = 0
+    skipped_events = 0
+    pending = {}
+
+    def collect(done):
+        nonlocal inserted_events, skipped_events
+        for future in done:
+            partition_id, partition_rows = pending.pop(future)
+            try:
+                pid, rows, duration = future.result()
+            except Exception as err:
+                print(f"Partition {partition_id} ({partition_rows} rows) failed: {err}")
+                failed_partitions.append(partition_id)
+                continue
+            worker_stats[pid][0] += rows
+            worker_stats[pid][1] += duration
+            inserted_events += rows
+            # події частини, які вже були в таблиці
+            skipped_events += partition_rows - rows
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(bulk,)) as pool:
+        partition_id = 0
+        for df_events in chunks:
+            events, skipped = build_ad_event_frame(df_events, campaign_map)
+            skipped_events += skipped
+
+            for offset in range(0, len(events), batch_size):
+                partition = events.iloc[offset:offset + batch_size]
+                future = pool.submit(load_partition, partition_id, partition, retries)
+                pending[future] = (partition_id, len(partition))
+                partition_id += 1
+
+                if len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+        collect(wait(pending).done)
+
+    for pid, (rows, duration) in sorted(worker_stats.items()):
+        rate = rows / duration if duration else 0.0
+        print(f"Worker {pid}: {rows} rows in {duration:.2f}s ({rate:,.0f} rows/sec)")
+    if failed_partitions:
+        print(f"Failed partitions (not loaded): {sorted(failed_partitions)}")
+
+    return inserted_events, skipped_events, failed_partitions
+
+
+# ------------- Loading to MySQL ----------------
+
+def events_watermark(events):
+    return events["Timestamp"].max() if len(events) else None
+
+
+def run(
+    events_pattern=EVENTS_CSV,
+    chunksize=None,
+    bulk=False,
+    defer_indexes=False,
+    workers=1,
+    batch_size=10000,
+    incremental=False,
+    staged=False,
+    report=None,
+):
+    report = report or RunReport("transform_load")
+    if staged:
+        # CSV -> Parquet тільки для змінених файлів, далі кожна партиція дня - окреме джерело подій
+        print("Staging mode: CSV files are converted to Parquet once, events are read by date partitions")
+        with report.stage("staging") as stage:
+            with stage.phase("parse"):
+                stage.rows_written = sum(staging.stage_all(events_pattern, chunksize).values())
+        event_files = [path for _, path in staging.list_partitions()]
+    else:
+        event_files = sorted(glob.glob(events_pattern))
+
+    if chunksize:
+        print(f"Streaming mode: {chunksize} rows per chunk")
+    if bulk:
+        print("Bulk mode: Users and AdEvents are loaded with LOAD DATA LOCAL INFILE")
+    if workers > 1:
+        print(f"Parallel mode: AdEvents are loaded by {workers} workers, {batch_size} rows per partition")
+    if incremental:
+        print("Incremental mode: only new or changed files are loaded")
+
+    print("Connecting to database...")
+    conn = None
+    cache = None
+
+    try:
+        # всі запити через conn рахуються в метриках поточного етапу
+        conn = report.track_mysql(mysql.connector.connect(**DB_CONFIG, allow_local_infile=bulk))
+        cursor = conn.cursor()
+
+        conn.start_transaction()
+        print("Connected to DB. Transaction started.")
+
+        with report.stage("plan") as stage:
+            ensure_manifest(cursor)
+            load_users, load_campaigns, event_sources, fingerprints = plan_sources(
+                cursor, event_files, incremental
+            )
+
+            # ID довідників беруться з локального кешу; MySQL перечитується тільки для змінених таблиць
+            cache = DimensionCache()
+            cache.sync(conn)
+
+        print("Loading CSV files...")
+        with report.stage("read_dimensions") as stage:
+            with stage.phase("parse"):
+                df_campaigns = read_campaigns(cache, staged) if load_campaigns else None
+                advertiser_names, unique_locations, all_interests = collect_dimensions(
+                    df_campaigns, event_sources, load_users, chunksize, staged
+                )
+            stage.rows_read = len(advertiser_names) + len(unique_locations) + len(all_interests)
+
+        # ------------ Advertisers ----------------
+        # в MySQL вставляються тільки назви, яких ще немає в кеші
+        print("Import to Advertisers")
+        with report.stage("advertisers") as stage:
+            with stage.phase("write"):
+                advertiser_map = cache.ensure(conn, "Advertisers", advertiser_names)
+            stage.rows_read = len(advertiser_names)
+
+        # ------------ Locations ----------------
+        print("Import to Locations")
+        with report.stage("locations") as stage:
+            with stage.phase("write"):
+                location_map = cache.ensure(conn, "Locations", unique_locations)
+            stage.rows_read = len(unique_locations)
+
+        # ------------ Interests ----------------
+        print("Import to Interests")
+        with report.stage("interests") as stage:
+            with stage.phase("write"):
+                interest_map = cache.ensure(conn, "Interests", all_interests)
+            stage.rows_read = len(all_interests)
+
+        # ------------ Users + UserInterests ----------------
+        if bulk:
+            set_bulk_session(cursor)
+
+        if load_users:
+            print("Import to Users and UserInterests")
+            with report.stage("users") as stage:
+                users_loaded = 0
+                for df_users in stage.timed_iter(iter_users(chunksize, staged=staged)):
+                    with stage.phase("transform"):
+                        users, user_interests = build_user_frames(df_users, location_map, interest_map)
+                    with stage.phase("write"):
+                        if bulk:
+                            bulk_load(cursor, "Users", users, ignore=True)
+                        else:
+                            cursor.executemany(
+                                """
+                                INSERT IGNORE INTO Users (UserID, Age, Gender, LocationID, SignupDate)
+                                VALUES (%s, %s, %s, %s, %s)
+                                """,
+                                to_params(users, USER_COLUMNS),
+                            )
+                        cursor.executemany(
+                            "INSERT IGNORE INTO UserInterests (UserID, InterestID) VALUES (%s, %s)",
+                            to_params(user_interests, ["UserID", "InterestID"]),
+                        )
+                        users_loaded += len(df_users)
+                        conn.commit()
+                    stage.rows_read += len(df_users)
+                    stage.rows_written += len(users) + len(user_interests)
+                save_entry(cursor, USERS_CSV, fingerprints[USERS_CSV], users_loaded, True)
+                conn.commit()
+        else:
+            print("Users are unchanged since the last run")
+
+        # ------------ Campaigns ----------------
+        # Фіксована кількість запитів незалежно від кількості кампаній: один пакетний upsert,
+        # одне перечитування Campaigns у кеш і один пакетний INSERT у CampaignInterests.
+        # CampaignName унікальний, тому існуючі кампанії оновлюються (бюджети, дати, таргетинг)
+        with report.stage("campaigns") as stage:
+            if load_campaigns:
+                print("Import to Campaigns")
+                with stage.phase("transform"):
+                    campaign_rows = build_campaign_rows(df_campaigns, advertiser_map, location_map)
+                with stage.phase("write"):
+                    cursor.executemany(
+                        """
+                        INSERT INTO Campaigns (
+                            AdvertiserID, CampaignName, CampaignStartDate, CampaignEndDate,
+                            Budget, RemainingBudget, TargetingAgeMin, TargetingAgeMax, TargetingLocationID, AdSlotSize
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) AS new
+                        ON DUPLICATE KEY UPDATE
+                            AdvertiserID = new.AdvertiserID,
+                            CampaignStartDate = new.CampaignStartDate,
+                            CampaignEndDate = new.CampaignEndDate,
+                            Budget = new.Budget,
+                            RemainingBudget = new.RemainingBudget,
+                            TargetingAgeMin = new.TargetingAgeMin,
+                            TargetingAgeMax = new.TargetingAgeMax,
+                            TargetingLocationID = new.TargetingLocationID,
+                            AdSlotSize = new.AdSlotSize
+                        """,
+                        campaign_rows,
+                    )
+                    conn.commit()
+                    cache.reload(conn, "Campaigns")
+                stage.rows_read = len(df_campaigns)
+                stage.rows_written = len(campaign_rows)
+            else:
+                print("Campaigns are unchanged since the last run")
+
+            campaign_map = cache.get_map("Campaigns")
+
+            if load_campaigns:
+                # CampaignInterests
+                with stage.phase("transform"):
+                    campaign_interest_rows = build_campaign_interest_rows(
+                        df_campaigns, campaign_map, interest_map
+                    )
+                with stage.phase("write"):
+                    cursor.executemany(
+                        "INSERT IGNORE INTO CampaignInterests (CampaignID, InterestID) VALUES (%s, %s)",
+                        campaign_interest_rows,
+                    )
+                    save_entry(cursor, CAMPAIGNS_CSV, fingerprints[CAMPAIGNS_CSV], len(df_campaigns), True)
+                    conn.commit()
+                stage.rows_written += len(campaign_interest_rows)
+
+        # ------------ AdEvents ----------------
+        # CampaignID визначається для кожної частини окремо, коміт після кожної частини
+        # разом з позицією у файлі, тому перерваний запуск продовжується з останньої частини
+        print("Import to AdEvents")
+        inserted_events = 0
+        skipped_events = 0
+        failed_partitions = {}
+
+        with report.stage("ad_events") as stage:
+            dropped_indexes = drop_deferred_indexes(cursor) if bulk and defer_indexes and event_sources else []
+            try:
+                for path, skip_rows in event_sources:
+                    print(f"Loading {path} from row {skip_rows}")
+                    if workers > 1:
+                        # запити воркерів (власні з'єднання) в round_trips не потрапляють
+                        inserted, skipped, failed = load_ad_events_parallel(
+                            iter_events(path, chunksize, skip_rows=skip_rows),
+                            campaign_map,
+                            workers,
+                            batch_size,
+                            bulk,
+                        )
+                        inserted_events += inserted
+                        skipped_events += skipped
+                        stage.rows_read += inserted + skipped
+                        stage.rows_written += inserted
+                        if failed:
+                            failed_partitions[path] = failed
+                        else:
+                            rows_loaded = skip_rows + inserted + skipped
+                            save_entry(cursor, path, fingerprints[path], rows_loaded, True)
+                            conn.commit()
+                        continue
+
+                    rows_loaded = skip_rows
+                    for df_events in stage.timed_iter(iter_events(path, chunksize, skip_rows=skip_rows)):
+                        with stage.phase("transform"):
+                            events, skipped = build_ad_event_frame(df_events, campaign_map)
+                        with stage.phase("write"):
+                            inserted = insert_ad_events(cursor, events, bulk)
+                            rows_loaded += len(df_events)
+                            save_entry(
+                                cursor, path, fingerprints[path], rows_loaded, False, events_watermark(events)
+                            )
+                            conn.commit()
+                        inserted_events += inserted
+                        skipped_events += skipped + len(events) - inserted
+                        stage.rows_read += len(df_events)
+                        stage.rows_written += inserted
+                    save_entry(cursor, path, fingerprints[path], rows_loaded, True)
+                    conn.commit()
+            finally:
+                with stage.phase("write"):
+                    restore_deferred_indexes(cursor, dropped_indexes)
+
+        if bulk:
+            cursor.execute("SET SESSION unique_checks = 1")
+
+        print(f"Inserted {inserted_events} AdEvents. Skipped {skipped_events}.")
+
+        # ------------ Done ----------------
+        conn.commit()
+        if failed_partitions:
+            # завантажені частини закомічені, але позиція файлу не збережена - файл з частинами, що не
+            # завантажились, не вважається завантаженим; ненульовий код виходу для планувальника
+            raise RuntimeError(
+                "AdEvents partitions not loaded after retries: "
+                + "; ".join(f"{path}: {sorted(ids)}" for path, ids in failed_partitions.items())
+            )
+        print("ETL finished successfully. Transaction committed.")
+
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
+        if conn is not None:
+            conn.rollback()
+            print("Transaction rolled back.")
+
+    finally:
+        if cache is not None:
+            cache.close()
+        if conn is not None and conn.is_connected():
+            cursor.close()
+            conn.close()
+            print("MySQL connection closed.")
+        report.save()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events",
+        help="Event CSV file or glob pattern, e.g. '/data/events/*.csv'",
+        type=str,
+        default=EVENTS_CSV,
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Skip files loaded by previous runs and continue partially loaded event files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--staged",
+        help="Convert CSV files to the Parquet staging layer first and load events from its date partitions",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        help="Read events and users in chunks of N rows and commit after each chunk (default: whole file at once)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--bulk",
+        help="Load Users and AdEvents via temporary TSV files and LOAD DATA LOCAL INFILE",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--defer-indexes",
+        help="With --bulk: drop secondary AdEvents indexes during the load and rebuild them afterwards",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of worker processes (each with its own connection) for the AdEvents load",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--batch-size",
+        help="With --workers: AdEvents rows per partition/transaction",
+        type=int,
+        default=10000,
+    )
+    parser.add_argument(
+        "--report-dir",
+        help="Directory for the JSON run report (default: $ETL_REPORT_DIR or /data/reports)",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile every stage; 'cprofile' writes one .prof file per stage next to the report",
+        choices=["cprofile"],
+        default=None,
+    )
+    args = parser.parse_args()
+
+    report = RunReport(
+        "transform_load",
+        report_dir=args.report_dir or REPORT_DIR,
+        profile=args.profile or PROFILE,
+    )
+    run(
+        events_pattern=args.events,
+        chunksize=args.chunk_size,
+        bulk=args.bulk,
+        defer_indexes=args.defer_indexes,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        incremental=args.incremental,
+        staged=args.staged,
+        report=report,
+    )
@@ -1,6 +1,7 @@
 CREATE DATABASE IF NOT EXISTS ad_analytics;
 
 USE ad_analytics;
+DROP TABLE IF EXISTS EtlManifest;
 DROP TABLE IF EXISTS CampaignInterests;
 DROP TABLE IF EXISTS UserInterests;
 DROP TABLE IF EXISTS AdEvents;
@@ -45,6 +46,7 @@ CREATE TABLE Campaigns (
     AdSlotSize VARCHAR(50),
     FOREIGN KEY (AdvertiserID) REFERENCES Advertisers(AdvertiserID),
     FOREIGN KEY (TargetingLocationID) REFERENCES Locations(LocationID),
+    UNIQUE KEY uq_campaign_name (CampaignName),
     INDEX idx_advertiser_id (AdvertiserID)
 );
 
@@ -89,13 +91,17 @@ CREATE TABLE AdEvents (
     AdRevenue DECIMAL(10, 2) CHECK (AdRevenue >= 0),
     WasClicked TINYINT(1) NOT NULL DEFAULT 0,
     ClickTimestamp DATETIME NULL,
+    -- порядок завантаження: load_to_cassandra.py --incremental читає нові події після свого watermark за ним,
+    -- а не за Timestamp, бо події з будь-яким часом можуть бути дописані пізніше
+    LoadSeq BIGINT NOT NULL AUTO_INCREMENT,
     FOREIGN KEY (CampaignID) REFERENCES Campaigns(CampaignID),
     FOREIGN KEY (UserID) REFERENCES Users(UserID),
     INDEX idx_campaign_id (CampaignID),
     INDEX idx_user_id (UserID),
     INDEX idx_was_clicked (WasClicked),
     INDEX idx_timestamp (Timestamp),
-    INDEX idx_device_timestamp (Device, Timestamp)
+    INDEX idx_device_timestamp (Device, Timestamp),
+    UNIQUE INDEX idx_load_seq (LoadSeq)
 );
 
 CREATE TABLE UserInterests (
@@ -114,3 +120,16 @@ CREATE TABLE CampaignInterests (
     FOREIGN KEY (InterestID) REFERENCES Interests(InterestID)
 );
 
+/*
+EtlManifest - які файли вже завантажені ETL (відбиток файлу, кількість завантажених рядків, максимальний Timestamp).
+Потрібен для інкрементального запуску transform_load.py --incremental
+*/
+
+CREATE TABLE EtlManifest (
+    SourceName VARCHAR(255) PRIMARY KEY,
+    Fingerprint VARCHAR(64) NOT NULL,
+    RowsLoaded BIGINT NOT NULL DEFAULT 0,
+    Completed TINYINT(1) NOT NULL DEFAULT 0,
+    Watermark DATETIME NULL,
+    UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);